@@ -0,0 +1,168 @@
+import json
+import time
+import uuid
+import hashlib
+import logging
+from collections import OrderedDict
+from fastapi import Request, Response
+from app.config import RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE, CACHE_REDIS_URL
+from app import notifications
+
+
+class ResponseCache:
+    """
+    Short-TTL cache of rendered JSON bodies for read-heavy routes.
+
+    Keys carry a per-account generation; invalidating an account bumps the
+    generation, so stale entries are never read again and simply age out.
+    Tier 1 is an in-process LRU. Tier 2 (CACHE_REDIS_URL) is shared by all
+    API replicas. With Redis the key uses only the shared generation, which
+    the worker bumps once per insert (MAILREADER-WORKER app/db.py), so every
+    replica builds the same keys. The local generation (bumped by NOTIFY)
+    is the fallback while Redis is unreachable.
+    Inserts (worker) and deletes (db-controller retention, account deletion)
+    both bump the generations.
+    """
+
+    def __init__(self, ttl: int, size: int, redis_url: str = ""):
+        self.ttl = ttl
+        self.size = size
+        self._mem = OrderedDict()  # key -> (expires_at, body, etag)
+        self._gen = {}             # account_id -> local generation
+        self._redis = None
+
+        if redis_url:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(redis_url)
+
+    # -------- generations --------
+    @staticmethod
+    def _account(account_id) -> str:
+        # one key space per account however the id was spelled in the URL;
+        # the worker and the db-controller bump the canonical form
+        try:
+            return str(uuid.UUID(str(account_id)))
+        except ValueError:
+            return str(account_id)
+
+    async def _generation(self, account_id: str) -> str:
+        local = f"l{self._gen.get(account_id, 0)}"
+        if self._redis is None:
+            return local
+        try:
+            shared = await self._redis.get(f"mailreader:gen:{account_id}")
+        except Exception as e:
+            logging.warning(f"CACHE REDIS GET FAILED: {e}")
+            return local
+        return f"s{(shared or b'0').decode()}"
+
+    def invalidate(self, account_id: str):
+        account_id = self._account(account_id)
+        self._gen[account_id] = self._gen.get(account_id, 0) + 1
+
+    async def bump(self, account_id: str):
+        """
+        Shared generation, for changes made by the API itself. Other
+        replicas drop their local generation through the NOTIFY sent with
+        the change.
+        """
+        account_id = self._account(account_id)
+        self.invalidate(account_id)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.incr(f"mailreader:gen:{account_id}")
+        except Exception as e:
+            logging.warning(f"CACHE REDIS INCR FAILED: {e}")
+
+    def clear_local(self):
+        self._mem.clear()
+
+    # -------- entries --------
+    async def key(self, request: Request, account_id: str) -> str:
+        params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        account_id = self._account(account_id)
+        gen = await self._generation(account_id)
+        return f"{account_id}:{gen}:{request.url.path}?{params}"
+
+    async def get(self, key: str):
+        entry = self._mem.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._mem.move_to_end(key)
+                return entry[1], entry[2]
+            del self._mem[key]
+
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(f"mailreader:resp:{key}")
+            except Exception as e:
+                logging.warning(f"CACHE REDIS GET FAILED: {e}")
+                raw = None
+            if raw:
+                etag, body = raw.split(b"\n", 1)
+                self._remember(key, body, etag.decode())
+                return body, etag.decode()
+
+        return None
+
+    def _remember(self, key: str, body: bytes, etag: str):
+        self._mem[key] = (time.monotonic() + self.ttl, body, etag)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.size:
+            self._mem.popitem(last=False)
+
+    async def set(self, key: str, body: bytes, etag: str):
+        self._remember(key, body, etag)
+        if self._redis is not None:
+            try:
+                await self._redis.set(f"mailreader:resp:{key}", etag.encode() + b"\n" + body, ex=self.ttl)
+            except Exception as e:
+                logging.warning(f"CACHE REDIS SET FAILED: {e}")
+
+
+cache = ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE, CACHE_REDIS_URL)
+
+
+# -------- worker inserts / controller deletes -> invalidate (see app/notifications.py) --------
+@notifications.on_notify
+def _invalidate_on_change(payload: dict):
+    account_id = payload.get("account_id")
+    if account_id:
+        cache.invalidate(account_id)
+
+
+@notifications.on_reset
+def _flush_on_reconnect():
+    cache.clear_local()
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return etag in [t.strip() for t in header.split(",")] or header.strip() == "*"
+
+
+async def cached_json(request: Request, account_id: str, producer) -> Response:
+    """
+    Serves `await producer()` through the cache, with ETag / If-None-Match.
+    """
+    key = await cache.key(request, account_id)
+    hit = await cache.get(key)
+
+    if hit is None:
+        data = await producer()
+        # same encoding as FastAPI's JSONResponse
+        body = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        etag = _etag(body)
+        await cache.set(key, body, etag)
+    else:
+        body, etag = hit
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
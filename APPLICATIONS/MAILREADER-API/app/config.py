@@ -4,4 +4,25 @@ DATABASE_URL = os.getenv("DATABASE_URL", "")
 LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://skylight-engineer-mailreader-llm:8080")
 
 MASTER_KEY = os.getenv("MAILREADER_MASTER_KEY", "")
+# previous master keys, comma separated: decrypt only (key rotation)
+MASTER_OLD_KEYS = [k.strip() for k in os.getenv("MAILREADER_OLD_KEYS", "").split(",") if k.strip()]
 RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "3"))
+
+# ================== DB POOL ==================
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# asyncpg prepared statement cache per connection (0 behind pgbouncer)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# ================== RESPONSE CACHE ==================
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "5"))          # seconds
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))     # entries per process
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")                      # optional shared tier
+
+# ================== SSE STREAM ==================
+STREAM_HEARTBEAT = int(os.getenv("STREAM_HEARTBEAT", "15"))            # seconds between keepalive comments
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "500"))         # pending events per client
+
+# ================== EXPORT ==================
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))       # rows per server-side cursor fetch
@@ -5,9 +5,11 @@ from sqlalchemy import (
     DateTime,
     Text,
     Integer,
+    BigInteger,
     ForeignKey,
     Float,
     UniqueConstraint,
+    Index,
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
@@ -211,3 +213,60 @@ class Email(Base):
             name="uq_email_account_message",
         ),
     )
+
+
+class EmailCounter(Base):
+    """
+    Per-account/category email count, kept in sync by statement triggers on
+    `emails` (installed by the DB controller) and reconciled periodically.
+    """
+    __tablename__ = "email_counters"
+
+    account_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("accounts.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    category: Mapped[str] = mapped_column(
+        String(32),
+        primary_key=True,
+    )
+
+    count: Mapped[int] = mapped_column(
+        BigInteger,
+        default=0,
+    )
+
+
+# ================== EMAIL INDEX PLAN ==================
+# mirrors the hot queries in routes/emails.py (EXPLAINed by
+# tests/test_query_plans.py); the DB controller builds
+# these CONCURRENTLY on existing databases (same names)
+
+# per-account timeline: /emails, /emails/latest, /emails/count
+Index(
+    "ix_emails_account_received",
+    Email.account_id,
+    Email.received_at.desc(),
+    Email.id.desc(),
+)
+
+# per-account-per-category timeline + keyset pagination: /emails?category=
+Index(
+    "ix_emails_account_category_received",
+    Email.account_id,
+    Email.category,
+    Email.received_at.desc(),
+    Email.id.desc(),
+)
+
+# dashboard cards: /emails/important
+Index(
+    "ix_emails_account_important",
+    Email.account_id,
+    Email.received_at.desc(),
+    postgresql_where=Email.category == "important",
+)
+
+# retention: DELETE ... WHERE expires_at < now() -> ix_emails_expires_at (column index)
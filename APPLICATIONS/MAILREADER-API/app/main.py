@@ -1,17 +1,21 @@
+import json
 from datetime import datetime
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from sqlalchemy import select
+from sqlalchemy import select, text
 
 import requests
 from urllib.parse import urlencode
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import RETENTION_DAYS
-from app.db.session import SessionLocal, engine
+from app.db.session import SessionLocal, engine, async_engine
 from app.db.models import Base, Account, Secret, Rule
 from app.security.encryption import encrypt_payload, decrypt_payload
 from app.routes import emails
 from app.routes import rules
+from app import notifications
+from app.cache import cache
 
 
 # 🔑 FastAPI app MUTLAKA ÖNCE TANIMLANIR
@@ -33,8 +37,16 @@ app.include_router(emails.router)
 app.include_router(rules.router)
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     Base.metadata.create_all(bind=engine)
+    # worker NOTIFYs -> response cache invalidation
+    notifications.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await notifications.stop()
+    await async_engine.dispose()
 
 
 @app.get("/health")
@@ -243,8 +255,7 @@ def retention_info():
         "policy": "emails are deleted after expires_at < now()"
     }
 
-@app.delete("/accounts/{account_id}")
-def delete_account(account_id: str):
+def _delete_account_rows(account_id: str):
     with SessionLocal() as db:
         acc = db.execute(
             select(Account).where(Account.id == account_id)
@@ -259,9 +270,20 @@ def delete_account(account_id: str):
         # - Emails
         # yoksa da SQLAlchemy ilişkiyi çözer
         db.delete(acc)
+        # sent at commit: every API replica drops the account's cached responses
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": notifications.CHANNEL, "payload": json.dumps({"account_id": str(acc.id), "deleted": True})},
+        )
         db.commit()
 
-        return {
-            "status": "deleted",
-            "account_id": account_id
-        }
+
+@app.delete("/accounts/{account_id}")
+async def delete_account(account_id: str):
+    await run_in_threadpool(_delete_account_rows, account_id)
+    await cache.bump(account_id)
+
+    return {
+        "status": "deleted",
+        "account_id": account_id
+    }
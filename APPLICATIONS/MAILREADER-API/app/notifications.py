@@ -0,0 +1,127 @@
+import json
+import asyncio
+import logging
+import asyncpg
+from contextlib import contextmanager
+from sqlalchemy.engine import make_url
+from app.config import DATABASE_URL, STREAM_QUEUE_SIZE
+
+# the worker sends pg_notify(CHANNEL, '{"account_id", "inserted", "emails"}')
+# in its insert transaction (MAILREADER-WORKER app/db.py); deletes send
+# '{"account_id", "deleted": true}' (db-controller retention, DELETE /accounts)
+CHANNEL = "mailreader_emails"
+
+LISTEN_DSN = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+_HANDLERS = []        # fn(payload: dict) on every notification
+_RESET_HANDLERS = []  # fn() after (re)connect: notifications may have been missed
+_SUBSCRIBERS = {}     # account_id -> set of asyncio.Queue (SSE streams)
+_TASK = None
+
+
+def on_notify(fn):
+    _HANDLERS.append(fn)
+    return fn
+
+
+def on_reset(fn):
+    _RESET_HANDLERS.append(fn)
+    return fn
+
+
+def _dispatch(conn, pid, channel, payload):
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        logging.warning(f"BAD NOTIFY PAYLOAD on {channel}: {payload[:200]}")
+        return
+
+    for fn in _HANDLERS:
+        try:
+            fn(data)
+        except Exception as e:
+            logging.error(f"NOTIFY HANDLER ERROR: {e}")
+
+    for queue in list(_SUBSCRIBERS.get(data.get("account_id"), ())):
+        for item in data.get("emails") or []:
+            _publish(queue, ("email", item))
+
+
+def _publish(queue: asyncio.Queue, event: tuple):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # slow client: drop the backlog and tell it to refetch
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(("reset", {}))
+
+
+@contextmanager
+def subscribe(account_id: str):
+    """
+    Yields a queue of (event, data) for new mail of one account.
+    "reset" means events may have been lost and the client should refetch.
+    """
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    _SUBSCRIBERS.setdefault(account_id, set()).add(queue)
+    try:
+        yield queue
+    finally:
+        subscribers = _SUBSCRIBERS.get(account_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del _SUBSCRIBERS[account_id]
+
+
+def _reset_subscribers():
+    for subscribers in _SUBSCRIBERS.values():
+        for queue in subscribers:
+            _publish(queue, ("reset", {}))
+
+
+async def _listen_forever():
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(LISTEN_DSN)
+            await conn.add_listener(CHANNEL, _dispatch)
+
+            for fn in _RESET_HANDLERS:
+                fn()
+            _reset_subscribers()
+
+            # asyncpg delivers notifications in the background; just keep
+            # checking the connection so a dead one gets replaced
+            while not conn.is_closed():
+                await asyncio.sleep(30)
+                await conn.execute("SELECT 1")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"LISTEN {CHANNEL} FAILED: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+
+        await asyncio.sleep(5)
+
+
+def start():
+    global _TASK
+    if _TASK is None:
+        _TASK = asyncio.get_running_loop().create_task(_listen_forever())
+
+
+async def stop():
+    global _TASK
+    if _TASK is not None:
+        _TASK.cancel()
+        try:
+            await _TASK
+        except asyncio.CancelledError:
+            pass
+        _TASK = None
+
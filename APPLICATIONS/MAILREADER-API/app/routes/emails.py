@@ -1,64 +1,151 @@
-from fastapi import APIRouter, Query, HTTPException
-from sqlalchemy import select, func
-from app.db.session import SessionLocal
-from app.db.models import Email
-from datetime import datetime
+import io
+import csv
+import json
+import uuid
+import base64
+import asyncio
+import binascii
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_async_db, AsyncSessionLocal
+from app.db.models import Email, EmailCounter
+from app.cache import cached_json
+from app.config import STREAM_HEARTBEAT, EXPORT_BATCH_SIZE
+from app import notifications
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/emails", tags=["emails"])
 
 
+# =========================================================
+# KEYSET CURSOR: opaque base64url("<received_at iso>|<id>")
+# =========================================================
+def _encode_cursor(e: Email) -> str:
+    raw = f"{e.received_at.isoformat()}|{e.id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        ts, eid = raw.split("|", 1)
+        return datetime.fromisoformat(ts), uuid.UUID(eid)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _list_item(e: Email) -> dict:
+    return {
+        "id": str(e.id),
+        "from": e.from_addr,
+        "to": e.to_addr,
+        "subject": e.subject,
+        "category": e.category,
+        "confidence": e.confidence,
+        "reason": e.reason,
+        "received_at": e.received_at.isoformat(),
+    }
+
+
+# =========================================================
+# QUERIES (one per access path; tests/test_query_plans.py
+# EXPLAINs these against the index plan in app/db/models.py)
+# =========================================================
+def _timeline_query(account_id: str, category: str | None = None):
+    q = select(Email).where(Email.account_id == account_id)
+    if category:
+        q = q.where(Email.category == category)
+    return q
+
+
+def _list_offset_query(account_id: str, category: str | None, limit: int, offset: int):
+    return _timeline_query(account_id, category).order_by(Email.received_at.desc()).limit(limit).offset(offset)
+
+
+def _list_keyset_query(account_id: str, category: str | None, limit: int, after: tuple | None = None):
+    q = _timeline_query(account_id, category)
+    if after is not None:
+        q = q.where(tuple_(Email.received_at, Email.id) < tuple_(*after))
+    # one extra row tells whether another page exists
+    return q.order_by(Email.received_at.desc(), Email.id.desc()).limit(limit + 1)
+
+
+def _important_query(account_id: str, limit: int):
+    return _timeline_query(account_id, "important").order_by(Email.received_at.desc()).limit(limit)
+
+
+def _latest_query(account_id: str):
+    return _timeline_query(account_id).order_by(Email.received_at.desc()).limit(1)
+
+
+def _count_query(account_id: str, category: str | None = None):
+    # O(1): materialized counters instead of count(*) over emails
+    q = select(func.coalesce(func.sum(EmailCounter.count), 0)).where(
+        EmailCounter.account_id == account_id
+    )
+    if category:
+        q = q.where(EmailCounter.category == category)
+    return q
+
+
+def _export_query(account_id: str, category: str | None = None, since: datetime | None = None):
+    q = select(*EXPORT_COLUMNS).where(Email.account_id == account_id)
+    if category:
+        q = q.where(Email.category == category)
+    if since:
+        q = q.where(Email.received_at >= since)
+    return q.order_by(Email.received_at.asc(), Email.id.asc())
+
+
 # =========================================================
 # LIST EMAILS (GENEL LİSTE)
 # =========================================================
 @router.get("")
 @router.get("/")
-def list_emails(
+async def list_emails(
     account_id: str,
     category: str | None = None,
     limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    with SessionLocal() as db:
-        q = select(Email).where(Email.account_id == account_id)
-
-        if category:
-            q = q.where(Email.category == category)
+    """
+    Offset mode (default): plain list, as before.
+    Cursor mode (`cursor` present, empty for the first page):
+      {"items": [...], "next_cursor": "..." | null}
+    Each page is an index range scan on
+    (account_id, category, received_at DESC, id DESC), whatever its depth.
+    """
+    if cursor is None:
+        q = _list_offset_query(account_id, category, limit, offset)
+        rows = (await db.execute(q)).scalars().all()
+        return [_list_item(e) for e in rows]
 
-        q = q.order_by(Email.received_at.desc()).limit(limit).offset(offset)
-        rows = db.execute(q).scalars().all()
+    q = _list_keyset_query(account_id, category, limit, _decode_cursor(cursor) if cursor else None)
+    rows = (await db.execute(q)).scalars().all()
 
-        return [
-            {
-                "id": str(e.id),
-                "from": e.from_addr,
-                "to": e.to_addr,
-                "subject": e.subject,
-                "category": e.category,
-                "confidence": e.confidence,
-                "reason": e.reason,
-                "received_at": e.received_at.isoformat(),
-            }
-            for e in rows
-        ]
+    page = rows[:limit]
+    return {
+        "items": [_list_item(e) for e in page],
+        "next_cursor": _encode_cursor(page[-1]) if len(rows) > limit else None,
+    }
 
 
 # =========================================================
 # IMPORTANT EMAILS (DASHBOARD / UI KARTLARI İÇİN)
 # =========================================================
 @router.get("/important")
-def important_emails(
+async def important_emails(
+    request: Request,
     account_id: str,
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    with SessionLocal() as db:
-        q = (
-            select(Email)
-            .where(Email.account_id == account_id)
-            .where(Email.category == "important")
-            .order_by(Email.received_at.desc())
-            .limit(limit)
-        )
-        rows = db.execute(q).scalars().all()
+    async def produce():
+        rows = (await db.execute(_important_query(account_id, limit))).scalars().all()
 
         return [
             {
@@ -71,20 +158,20 @@ def important_emails(
             for e in rows
         ]
 
+    return await cached_json(request, account_id, produce)
+
 
 # =========================================================
 # LATEST EMAIL (HEADER / WIDGET İÇİN)
 # =========================================================
 @router.get("/latest")
-def latest_email(account_id: str):
-    with SessionLocal() as db:
-        q = (
-            select(Email)
-            .where(Email.account_id == account_id)
-            .order_by(Email.received_at.desc())
-            .limit(1)
-        )
-        e = db.execute(q).scalar_one_or_none()
+async def latest_email(
+    request: Request,
+    account_id: str,
+    db: AsyncSession = Depends(get_async_db),
+):
+    async def produce():
+        e = (await db.execute(_latest_query(account_id))).scalar_one_or_none()
 
         if not e:
             return None
@@ -99,27 +186,156 @@ def latest_email(account_id: str):
             "received_at": e.received_at.isoformat(),
         }
 
+    return await cached_json(request, account_id, produce)
+
 
 # =========================================================
 # EMAIL COUNT (UI BADGE / STAT)
 # =========================================================
 @router.get("/count")
-def email_count(
+async def email_count(
+    request: Request,
     account_id: str,
-    category: str | None = None
+    category: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    with SessionLocal() as db:
-        q = select(func.count()).select_from(Email).where(
-            Email.account_id == account_id
-        )
-
-        if category:
-            q = q.where(Email.category == category)
-
-        total = db.execute(q).scalar()
+    async def produce():
+        total = int((await db.execute(_count_query(account_id, category))).scalar())
 
         return {
             "account_id": account_id,
             "category": category,
             "count": total,
         }
+
+    return await cached_json(request, account_id, produce)
+
+
+# =========================================================
+# BULK EXPORT (NDJSON / CSV, server-side cursor)
+# =========================================================
+EXPORT_COLUMNS = (
+    Email.id,
+    Email.from_addr,
+    Email.to_addr,
+    Email.subject,
+    Email.category,
+    Email.confidence,
+    Email.reason,
+    Email.received_at,
+)
+EXPORT_FIELDS = ["id", "from", "to", "subject", "category", "confidence", "reason", "received_at"]
+
+
+def _export_rows(rows) -> list[list]:
+    return [
+        [str(r[0]), r[1], r[2], r[3], r[4], r[5], r[6], r[7].isoformat()]
+        for r in rows
+    ]
+
+
+def _ndjson_chunk(rows) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_FIELDS, r)), ensure_ascii=False) + "\n"
+        for r in _export_rows(rows)
+    ).encode("utf-8")
+
+
+def _csv_chunk(rows, header: bool = False) -> bytes:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    if header:
+        w.writerow(EXPORT_FIELDS)
+    w.writerows(_export_rows(rows))
+    return buf.getvalue().encode("utf-8")
+
+
+@router.get("/export")
+async def export_emails(
+    account_id: str,
+    since: datetime | None = None,
+    category: str | None = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+):
+    """
+    Every matching mail, oldest first (received_at >= since).
+    Rows come from a server-side cursor EXPORT_BATCH_SIZE at a time as plain
+    column tuples (no ORM objects), and each batch is written out before the
+    next is fetched, so memory does not grow with the result size.
+    The first batch is fetched before the response starts, so a failing
+    query is a real error status and not a truncated 200.
+    """
+    try:
+        uuid.UUID(account_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid account_id")
+
+    # received_at is naive UTC
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+    q = _export_query(account_id, category, since).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    # own session: a Depends() session is closed before the body is sent
+    db = AsyncSessionLocal()
+    try:
+        result = await db.stream(q)
+        partitions = result.partitions()
+        rows = await anext(partitions, None)
+    except Exception:
+        await db.close()
+        raise
+
+    async def body():
+        try:
+            if format == "csv":
+                yield _csv_chunk(rows or [], header=True)
+            elif rows:
+                yield _ndjson_chunk(rows)
+
+            async for more in partitions:
+                yield _csv_chunk(more) if format == "csv" else _ndjson_chunk(more)
+        finally:
+            await db.close()
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="emails-{account_id}.{format}"'},
+    )
+
+
+# =========================================================
+# NEW MAIL STREAM (SSE, fed by the worker's NOTIFY)
+# =========================================================
+@router.get("/stream")
+async def email_stream(request: Request, account_id: str):
+    """
+    text/event-stream of mail inserted after the client connected:
+      event: email  -> same item shape as GET /emails
+      event: reset  -> events were lost, refetch the list
+    A comment line is sent every STREAM_HEARTBEAT seconds so proxies keep
+    the connection open. No database work per client.
+    """
+    async def events():
+        with notifications.subscribe(account_id) as queue:
+            yield "retry: 5000\n\n"
+
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # nginx: do not buffer the stream
+        },
+    )
@@ -1,12 +1,15 @@
 import json
-from cryptography.fernet import Fernet
-from app.config import MASTER_KEY
+from functools import lru_cache
+from cryptography.fernet import Fernet, MultiFernet
+from app.config import MASTER_KEY, MASTER_OLD_KEYS
 
 
-def _fernet() -> Fernet:
+@lru_cache(maxsize=1)
+def _fernet() -> MultiFernet:
+    # built once; MASTER_KEY encrypts, MASTER_OLD_KEYS still decrypt during rotation
     if not MASTER_KEY:
         raise RuntimeError("MAILREADER_MASTER_KEY is not set")
-    return Fernet(MASTER_KEY.encode("utf-8"))
+    return MultiFernet([Fernet(k.encode("utf-8")) for k in [MASTER_KEY] + MASTER_OLD_KEYS])
 
 
 def encrypt_payload(payload: dict) -> str:
@@ -0,0 +1,83 @@
+"""
+MAILREADER-API LOAD TEST (stdlib only, not shipped in the image)
+
+Hammers the read endpoints with N keep-alive clients and prints req/s and
+latency percentiles per endpoint, e.g. before/after a deploy:
+
+  python loadtest.py --base http://localhost:8000 --account <uuid> -c 64 -d 30
+"""
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+ENDPOINTS = [
+    ("/emails", {"limit": 50}),
+    ("/emails/important", {"limit": 20}),
+    ("/emails/latest", {}),
+    ("/emails/count", {}),
+]
+
+
+def _worker(base, path, stop_at, latencies, errors, lock):
+    u = urlsplit(base)
+    conn_cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+    conn = conn_cls(u.hostname, u.port, timeout=30)
+    local, bad = [], 0
+
+    while time.monotonic() < stop_at:
+        started = time.monotonic()
+        try:
+            conn.request("GET", path)
+            r = conn.getresponse()
+            r.read()
+            if r.status >= 400:
+                bad += 1
+        except Exception:
+            bad += 1
+            conn.close()
+            conn = conn_cls(u.hostname, u.port, timeout=30)
+            continue
+        local.append(time.monotonic() - started)
+
+    conn.close()
+    with lock:
+        latencies.extend(local)
+        errors[0] += bad
+
+
+def run(base, account_id, concurrency, duration):
+    for path, params in ENDPOINTS:
+        query = urlencode({"account_id": account_id, **params})
+        full = f"{path}?{query}"
+
+        latencies, errors, lock = [], [0], threading.Lock()
+        stop_at = time.monotonic() + duration
+        threads = [
+            threading.Thread(target=_worker, args=(base, full, stop_at, latencies, errors, lock))
+            for _ in range(concurrency)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        latencies.sort()
+        n = len(latencies)
+        pct = lambda p: latencies[min(n - 1, int(n * p))] * 1000 if n else 0.0
+        print(
+            f"{path:<20} req/s={n / duration:8.1f}  p50={pct(0.50):7.1f}ms  "
+            f"p95={pct(0.95):7.1f}ms  p99={pct(0.99):7.1f}ms  errors={errors[0]}"
+        )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default="http://localhost:8000")
+    ap.add_argument("--account", required=True)
+    ap.add_argument("-c", "--concurrency", type=int, default=32)
+    ap.add_argument("-d", "--duration", type=int, default=20)
+    args = ap.parse_args()
+
+    run(args.base.rstrip("/"), args.account, args.concurrency, args.duration)
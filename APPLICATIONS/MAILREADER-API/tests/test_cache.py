@@ -0,0 +1,52 @@
+import asyncio
+
+from starlette.requests import Request
+
+from app.cache import ResponseCache, _invalidate_on_change
+
+ACCOUNT = "6f1c2e1a-7d3b-4c2a-9a51-3f0f7f2b9e10"
+
+
+def _request(path: str, query: str = "") -> Request:
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": []})
+
+
+def test_account_spellings_share_one_key():
+    cache = ResponseCache(ttl=5, size=16)
+    keys = {
+        asyncio.run(cache.key(_request("/emails", "limit=5"), spelling))
+        for spelling in (ACCOUNT, ACCOUNT.upper(), "{" + ACCOUNT + "}", ACCOUNT.replace("-", ""))
+    }
+    assert keys == {f"{ACCOUNT}:l0:/emails?limit=5"}
+
+
+def test_invalidate_by_any_spelling_changes_the_key():
+    cache = ResponseCache(ttl=5, size=16)
+    before = asyncio.run(cache.key(_request("/emails/count"), ACCOUNT.upper()))
+
+    cache.invalidate(ACCOUNT)
+
+    after = asyncio.run(cache.key(_request("/emails/count"), ACCOUNT.upper()))
+    assert before != after
+
+
+def test_delete_notification_invalidates():
+    from app.cache import cache
+
+    before = asyncio.run(cache.key(_request("/emails"), ACCOUNT))
+    _invalidate_on_change({"account_id": ACCOUNT.upper(), "deleted": True})
+    assert asyncio.run(cache.key(_request("/emails"), ACCOUNT)) != before
+
+
+def test_bump_without_redis_moves_the_local_generation():
+    cache = ResponseCache(ttl=5, size=16)
+    before = asyncio.run(cache.key(_request("/emails"), ACCOUNT))
+
+    asyncio.run(cache.bump(ACCOUNT.upper()))
+
+    assert asyncio.run(cache.key(_request("/emails"), ACCOUNT)) != before
+
+
+def test_non_uuid_account_ids_are_kept_as_is():
+    cache = ResponseCache(ttl=5, size=16)
+    assert asyncio.run(cache.key(_request("/emails"), "not-a-uuid")).startswith("not-a-uuid:")
@@ -0,0 +1,154 @@
+"""
+EXPLAIN of the statements the /emails routes build (app/routes/emails.py)
+against the index plan in app/db/models.py.
+
+Needs a Postgres: TEST_DATABASE_URL=postgresql+psycopg2://... (skipped
+otherwise). Runs in a throwaway schema that is dropped afterwards.
+"""
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from app.db.models import Base
+from app.routes import emails as routes
+
+# busy mailboxes (small ones are cheaper to sort than to walk), stored in
+# arrival order like the worker writes them
+ACCOUNTS = 100
+EMAILS_PER_ACCOUNT = 1000
+
+
+@pytest.fixture(scope="module")
+def pg():
+    url = os.getenv("TEST_DATABASE_URL", "")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+
+    schema = f"plans_{uuid.uuid4().hex[:12]}"
+    engine = create_engine(
+        make_url(url).set(drivername="postgresql+psycopg2"),
+        connect_args={"options": f"-csearch_path={schema}"},
+    )
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA {schema}"))
+    except OperationalError as e:
+        engine.dispose()
+        pytest.skip(f"no Postgres at TEST_DATABASE_URL: {e.orig}")
+
+    try:
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO accounts (id, email, auth_method, created_at)
+                SELECT gen_random_uuid(), 'user' || n || '@example.com', 'imap', now()
+                FROM generate_series(1, :accounts) n
+            """), {"accounts": ACCOUNTS})
+            conn.execute(text("""
+                INSERT INTO emails (id, account_id, message_id, from_addr, to_addr, subject,
+                                    category, confidence, reason, received_at, expires_at, created_at)
+                SELECT gen_random_uuid(), account_id, '<' || account_id || '.' || n || '>', 'a@example.com',
+                       email, 'subject ' || n, (ARRAY['important', 'normal', 'spam'])[1 + n % 3],
+                       50, 'rule', received_at, received_at + interval '3 days', received_at
+                FROM (
+                    SELECT a.id AS account_id, a.email, n, now() - random() * interval '3 days' AS received_at
+                    FROM accounts a, generate_series(1, :per_account) n
+                ) m
+                ORDER BY received_at
+            """), {"per_account": EMAILS_PER_ACCOUNT})
+            conn.execute(text("""
+                INSERT INTO email_counters (account_id, category, count)
+                SELECT account_id, category, count(*) FROM emails GROUP BY 1, 2
+            """))
+            conn.execute(text("ANALYZE"))
+            account_id = str(conn.execute(text("SELECT id FROM accounts ORDER BY email LIMIT 1")).scalar())
+            middle = conn.execute(text("""
+                SELECT received_at, id FROM emails WHERE account_id = :aid
+                ORDER BY received_at DESC, id DESC OFFSET :n LIMIT 1
+            """), {"aid": account_id, "n": EMAILS_PER_ACCOUNT // 2}).one()
+
+        yield engine, account_id, tuple(middle)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        engine.dispose()
+
+
+def _explain(engine, statement) -> dict:
+    # literal binds: the plan asyncpg gets for the first executions (custom plans)
+    sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()[0]["Plan"]
+
+
+def _nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _nodes(child)
+
+
+# access path -> (statement builder, indexes that may serve it, index delivers the order)
+CASES = {
+    "GET /emails": (
+        lambda aid, middle: routes._list_offset_query(aid, None, 50, 0),
+        {"ix_emails_account_received"}, True,
+    ),
+    "GET /emails?offset=": (
+        lambda aid, middle: routes._list_offset_query(aid, None, 50, 100),
+        {"ix_emails_account_received"}, True,
+    ),
+    "GET /emails?category=": (
+        lambda aid, middle: routes._list_offset_query(aid, "normal", 50, 0),
+        {"ix_emails_account_category_received"}, True,
+    ),
+    "GET /emails?cursor=": (
+        lambda aid, middle: routes._list_keyset_query(aid, None, 50),
+        {"ix_emails_account_received"}, True,
+    ),
+    "GET /emails?cursor=<page 2>": (
+        lambda aid, middle: routes._list_keyset_query(aid, None, 50, middle),
+        {"ix_emails_account_received"}, True,
+    ),
+    "GET /emails?category=&cursor=<page 2>": (
+        lambda aid, middle: routes._list_keyset_query(aid, "normal", 50, middle),
+        {"ix_emails_account_category_received"}, True,
+    ),
+    "GET /emails/important": (
+        lambda aid, middle: routes._important_query(aid, 20),
+        {"ix_emails_account_important", "ix_emails_account_category_received"}, True,
+    ),
+    "GET /emails/latest": (
+        lambda aid, middle: routes._latest_query(aid),
+        {"ix_emails_account_received"}, True,
+    ),
+    # every row of one account: sorting those is fine, walking the table is not
+    "GET /emails/export": (
+        lambda aid, middle: routes._export_query(aid),
+        {"ix_emails_account_received", "ix_emails_account_id"}, False,
+    ),
+    "GET /emails/export?category=&since=": (
+        lambda aid, middle: routes._export_query(aid, "spam", datetime(2000, 1, 1)),
+        {"ix_emails_account_category_received", "ix_emails_account_id"}, False,
+    ),
+}
+
+
+@pytest.mark.parametrize("route", list(CASES))
+def test_route_query_uses_planned_index(pg, route):
+    engine, account_id, middle = pg
+    build, expected, ordered = CASES[route]
+
+    plan = _explain(engine, build(account_id, middle))
+    nodes = list(_nodes(plan))
+    used = {n["Index Name"] for n in nodes if n.get("Index Name")}
+
+    assert used & expected, f"{route}: {used or 'no index'} (expected {' | '.join(sorted(expected))})"
+    assert not any(n["Node Type"] == "Seq Scan" and n.get("Relation Name") == "emails" for n in nodes), route
+    if ordered:
+        assert not any(n["Node Type"] in ("Sort", "Incremental Sort") for n in nodes), route
@@ -3,7 +3,7 @@
 #==========================LIBRARIES
 import uuid
 from datetime import datetime
-from sqlalchemy import String, DateTime, Text, Integer, ForeignKey
+from sqlalchemy import String, DateTime, Text, Integer, SmallInteger, BigInteger, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -110,3 +110,89 @@ class Email(Base):
         DateTime,
         index=True
     )
+
+    # dedup key of the plain table; with EMAILS_PARTITIONED the controller
+    # rebuilds emails as PARTITION BY RANGE (expires_at), PK (id, expires_at),
+    # and ix_emails_account_message replaces it (see app/main.py)
+    __table_args__ = (
+        UniqueConstraint("account_id", "message_id", name="uq_email_account_message"),
+    )
+
+
+#==========================EMAILS INDEX PLAN (SAME NAMES AS MAILREADER-API)
+#==========================PER-ACCOUNT TIMELINE
+Index(
+    "ix_emails_account_received",
+    Email.account_id,
+    Email.received_at.desc(),
+    Email.id.desc()
+)
+
+#==========================PER-ACCOUNT-PER-CATEGORY TIMELINE (KEYSET PAGINATION)
+Index(
+    "ix_emails_account_category_received",
+    Email.account_id,
+    Email.category,
+    Email.received_at.desc(),
+    Email.id.desc()
+)
+
+#==========================IMPORTANT CARDS (PARTIAL)
+Index(
+    "ix_emails_account_important",
+    Email.account_id,
+    Email.received_at.desc(),
+    postgresql_where=Email.category == "important"
+)
+
+#==========================RETENTION -> ix_emails_expires_at (COLUMN INDEX)
+
+
+#==========================SYNC STATE TABLE (WORKER WATERMARKS)
+class SyncState(Base):
+    __tablename__ = "sync_state"
+
+    account_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("accounts.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    imap_uidvalidity: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    imap_last_uid: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    graph_delta_link: Mapped[str | None] = mapped_column(Text, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.utcnow
+    )
+
+
+#==========================CLASSIFICATION CACHE (SHARED BETWEEN WORKERS)
+class ClassificationCache(Base):
+    __tablename__ = "classification_cache"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    category: Mapped[str] = mapped_column(String(32))
+    confidence: Mapped[int] = mapped_column(Integer)
+    reason: Mapped[str] = mapped_column(String(256))
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+#==========================EMAIL COUNTERS (MAINTAINED BY TRIGGERS ON emails)
+class EmailCounter(Base):
+    __tablename__ = "email_counters"
+
+    account_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("accounts.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    category: Mapped[str] = mapped_column(String(32), primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+#==========================CONFIG VERSION (BUMPED BY TRIGGERS ON accounts / secrets / rules)
+class ConfigVersion(Base):
+    __tablename__ = "config_version"
+
+    id: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0)
@@ -4,8 +4,12 @@
 import os
 import time
 import logging
-from sqlalchemy import text
-from sqlalchemy.exc import SQLAlchemyError
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable, CreateIndex
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
 
 from app.db.session import CREATE_ENGINE
 from app.db.models import Base
@@ -18,6 +22,33 @@ logging.basicConfig(
 )
 
 CHECK_INTERVAL = int(os.environ.get("CHECK_INTERVAL", "60"))
+COUNTER_RECONCILE_INTERVAL = int(os.environ.get("COUNTER_RECONCILE_INTERVAL", "3600"))
+
+#==========================MIGRATIONS
+# DDL gives up instead of queueing behind the worker / API (retried next loop)
+MIGRATION_LOCK_TIMEOUT = os.environ.get("MIGRATION_LOCK_TIMEOUT", "5s")
+MIGRATION_ADVISORY_LOCK = 741852963  # one migrating controller at a time
+
+#==========================PARTITIONED EMAILS (DAILY RANGES ON expires_at)
+EMAILS_PARTITIONED = os.environ.get("EMAILS_PARTITIONED", "false").strip().lower() in ("1", "true", "yes")
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "3"))
+PARTITION_PREMAKE_DAYS = int(os.environ.get("PARTITION_PREMAKE_DAYS", "7"))
+PARTITION_COPY_BATCH = int(os.environ.get("PARTITION_COPY_BATCH", "5000"))
+
+#==========================RETENTION (BATCHED DELETE OF EXPIRED ROWS)
+RETENTION_ENABLED = os.environ.get("RETENTION_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+RETENTION_BATCH_MIN = int(os.environ.get("RETENTION_BATCH_MIN", "100"))
+RETENTION_BATCH_MAX = int(os.environ.get("RETENTION_BATCH_MAX", "10000"))
+RETENTION_TARGET_MS = int(os.environ.get("RETENTION_TARGET_MS", "200"))     # wanted duration of one batch
+RETENTION_PAUSE_MS = int(os.environ.get("RETENTION_PAUSE_MS", "100"))       # breathing room between batches
+RETENTION_BUDGET = int(os.environ.get("RETENTION_BUDGET", "30"))           # seconds per loop
+RETENTION_BACKLOG_CAP = 100000
+
+#==========================API CACHE INVALIDATION (DELETES)
+# same channel as the worker's inserts: every API replica drops its local generation
+NOTIFY_CHANNEL = "mailreader_emails"
+# optional, same as the API's CACHE_REDIS_URL: shared generation bumped after commit
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "").strip()
 
 #==========================FUNCTIONS
 
@@ -26,9 +57,28 @@ def INTRO():
     time.sleep(1)
 
 
+#==========================BASELINE TABLES (MIGRATION 1)
+# frozen: a table added to models.py later gets its own migration
+BASELINE_TABLES = [
+    "accounts", "secrets", "rules", "emails",
+    "sync_state", "classification_cache", "email_counters",
+]
+
+
+def _BASELINE_DDL():
+    DIALECT = postgresql.dialect()
+    DDL = []
+    for NAME in BASELINE_TABLES:
+        TABLE = Base.metadata.tables[NAME]
+        DDL.append(str(CreateTable(TABLE).compile(dialect=DIALECT)))
+        for INDEX in sorted(TABLE.indexes, key=lambda I: I.name):
+            DDL.append(str(CreateIndex(INDEX).compile(dialect=DIALECT)))
+    return DDL
+
+
 def ENSURE_TABLES(ENGINE):
     try:
-        Base.metadata.create_all(bind=ENGINE)
+        Base.metadata.create_all(bind=ENGINE, tables=[Base.metadata.tables[NAME] for NAME in BASELINE_TABLES])
         logging.info("ALL TABLES CHECKED / CREATED IF NOT EXISTS")
         return 1
     except SQLAlchemyError as ERR:
@@ -37,102 +87,1010 @@ def ENSURE_TABLES(ENGINE):
         return 0
 
 
-def ENSURE_COLUMNS(ENGINE):
+#==========================LEGACY SCHEMA DRIFT (RUN ONCE, SEE MIGRATIONS)
+# accounts.provider NOT NULL, accounts.auth_method / created_at missing
+ACCOUNTS_LEGACY_COLUMNS = [
+    """
+    ALTER TABLE accounts
+    ADD COLUMN IF NOT EXISTS auth_method VARCHAR(32) DEFAULT 'imap';
+    """,
+    #==========================PROVIDER (OLD SCHEMA COMPAT)
+    """
+    ALTER TABLE accounts
+    ADD COLUMN IF NOT EXISTS provider VARCHAR(32);
+    """,
+    """
+    UPDATE accounts
+    SET provider = auth_method
+    WHERE provider IS NULL;
+    """,
+    """
+    ALTER TABLE accounts
+    ALTER COLUMN provider SET DEFAULT 'imap';
+    """,
+    """
+    ALTER TABLE accounts
+    ALTER COLUMN provider SET NOT NULL;
+    """,
+    #==========================CREATED_AT
+    """
+    ALTER TABLE accounts
+    ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();
+    """,
+]
+
+#==========================EMAILS AI COLUMNS
+EMAILS_AI_COLUMNS = [
+    """
+    ALTER TABLE emails
+    ADD COLUMN IF NOT EXISTS ai_category VARCHAR(32),
+    ADD COLUMN IF NOT EXISTS ai_confidence FLOAT,
+    ADD COLUMN IF NOT EXISTS ai_summary TEXT,
+    ADD COLUMN IF NOT EXISTS ai_model VARCHAR(128),
+    ADD COLUMN IF NOT EXISTS matched_rule VARCHAR(128),
+    ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();
+    """,
+]
+
+#==========================SYNC STATE (GRAPH DELTA)
+SYNC_STATE_DELTA_LINK = [
+    """
+    ALTER TABLE sync_state
+    ADD COLUMN IF NOT EXISTS graph_delta_link TEXT;
+    """,
+]
+
+
+DEDUP_INDEX = """
+    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_email_account_message
+    ON emails (account_id, message_id);
+"""
+
+
+def ENSURE_DEDUP_INDEX(ENGINE):
+    """
+    uq_email_account_message, built CONCURRENTLY (emails stays writable).
+    A partitioned emails cannot have it (unique keys must contain
+    expires_at); the worker's NOT EXISTS probe uses ix_emails_account_message.
+    """
+    try:
+        with ENGINE.connect().execution_options(isolation_level="AUTOCOMMIT") as CONN:
+            if IS_PARTITIONED(CONN):
+                return 1
+            INVALID = CONN.execute(text("""
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = 'uq_email_account_message' AND NOT i.indisvalid;
+            """)).scalar()
+            if INVALID:
+                CONN.execute(text("DROP INDEX CONCURRENTLY IF EXISTS uq_email_account_message;"))
+            CONN.execute(text(DEDUP_INDEX))
+        return 1
+    except SQLAlchemyError as ERR:
+        logging.error("DEDUP INDEX CHECK FAILED")
+        logging.error(ERR)
+        return 0
+
+
+#==========================INDEXES ON EXISTING TABLES
+# create_all only indexes NEW tables; CONCURRENTLY keeps emails writable
+# names / definitions = index plan in app/db/models.py (and MAILREADER-API)
+EMAIL_INDEXES = {
+    "ix_emails_account_received": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_emails_account_received
+        ON emails (account_id, received_at DESC, id DESC);
+    """,
+    "ix_emails_account_category_received": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_emails_account_category_received
+        ON emails (account_id, category, received_at DESC, id DESC);
+    """,
+    "ix_emails_account_important": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_emails_account_important
+        ON emails (account_id, received_at DESC)
+        WHERE category = 'important';
+    """,
+    "ix_emails_expires_at": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_emails_expires_at
+        ON emails (expires_at);
+    """,
+}
+
+def _INVALID_INDEXES(CONN):
+    ROWS = CONN.execute(text("""
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY(:names) AND NOT i.indisvalid;
+    """), {"names": list(EMAIL_INDEXES)}).scalars().all()
+    return set(ROWS)
+
+
+def ENSURE_INDEXES(ENGINE):
+    """
+    CREATE INDEX CONCURRENTLY for every planned index, then verify them.
+    A failed concurrent build leaves an INVALID index behind that IF NOT
+    EXISTS would happily skip -> drop and rebuild those.
+    """
+    try:
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        with ENGINE.connect().execution_options(isolation_level="AUTOCOMMIT") as CONN:
+            if IS_PARTITIONED(CONN):
+                # no CONCURRENTLY on partitioned tables; only build what is
+                # missing (new partitions inherit the indexes while empty)
+                PLANNED = {**EMAIL_INDEXES, **PARTITIONED_INDEXES}
+                EXISTING = _EXISTING_RELATIONS(CONN, list(PLANNED))
+                for NAME, DDL in PLANNED.items():
+                    if NAME not in EXISTING:
+                        CONN.execute(text(DDL.replace("CONCURRENTLY ", "")))
+                logging.info("EMAIL INDEXES CHECKED (PARTITIONED)")
+                return 1
+
+            for NAME in _INVALID_INDEXES(CONN):
+                logging.warning(f"INDEX {NAME} INVALID, REBUILDING")
+                CONN.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {NAME};"))
+
+            for NAME, DDL in EMAIL_INDEXES.items():
+                CONN.execute(text(DDL))
+
+            INVALID = _INVALID_INDEXES(CONN)
+
+        if INVALID:
+            logging.error(f"INDEXES STILL INVALID: {', '.join(sorted(INVALID))}")
+            return 0
+
+        logging.info("EMAIL INDEXES CHECKED / CREATED IF NOT EXISTS")
+        return 1
+    except SQLAlchemyError as ERR:
+        logging.error("INDEX CHECK FAILED")
+        logging.error(ERR)
+        return 0
+
+
+#==========================EMAIL COUNTERS
+# statement-level triggers with transition tables: one upsert per
+# (account, category) per statement, whoever writes (worker, retention, cascade)
+COUNTER_FUNCTIONS = [
+    """
+    CREATE OR REPLACE FUNCTION email_counters_ins() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO email_counters (account_id, category, count)
+        SELECT account_id, category, count(*)
+        FROM new_rows
+        WHERE category IS NOT NULL
+        GROUP BY account_id, category
+        ON CONFLICT (account_id, category)
+        DO UPDATE SET count = email_counters.count + EXCLUDED.count;
+        RETURN NULL;
+    END $$;
+    """,
+    """
+    CREATE OR REPLACE FUNCTION email_counters_del() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE email_counters c
+        SET count = GREATEST(c.count - d.n, 0)
+        FROM (
+            SELECT account_id, category, count(*) AS n
+            FROM old_rows
+            GROUP BY account_id, category
+        ) d
+        WHERE c.account_id = d.account_id AND c.category = d.category;
+        RETURN NULL;
+    END $$;
+    """,
+    """
+    CREATE OR REPLACE FUNCTION email_counters_upd() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE email_counters c
+        SET count = GREATEST(c.count - d.n, 0)
+        FROM (
+            SELECT account_id, category, count(*) AS n
+            FROM old_rows
+            GROUP BY account_id, category
+        ) d
+        WHERE c.account_id = d.account_id AND c.category = d.category;
+
+        INSERT INTO email_counters (account_id, category, count)
+        SELECT account_id, category, count(*)
+        FROM new_rows
+        WHERE category IS NOT NULL
+        GROUP BY account_id, category
+        ON CONFLICT (account_id, category)
+        DO UPDATE SET count = email_counters.count + EXCLUDED.count;
+        RETURN NULL;
+    END $$;
+    """,
+]
+
+COUNTER_TRIGGERS = {
+    "trg_email_counters_ins": """
+        CREATE TRIGGER trg_email_counters_ins
+        AFTER INSERT ON emails
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION email_counters_ins();
+    """,
+    "trg_email_counters_del": """
+        CREATE TRIGGER trg_email_counters_del
+        AFTER DELETE ON emails
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION email_counters_del();
+    """,
+    "trg_email_counters_upd": """
+        CREATE TRIGGER trg_email_counters_upd
+        AFTER UPDATE ON emails
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION email_counters_upd();
+    """,
+}
+
+
+def INSTALL_COUNTER_TRIGGERS(CONN):
+    """
+    Idempotent; runs inside the caller's transaction.
+    Triggers are only created when missing (no DDL lock on emails otherwise).
+    """
+    for DDL in COUNTER_FUNCTIONS:
+        CONN.execute(text(DDL))
+
+    EXISTING = set(CONN.execute(text("""
+        SELECT tgname FROM pg_trigger
+        WHERE tgrelid = 'emails'::regclass AND NOT tgisinternal;
+    """)).scalars().all())
+
+    for NAME, DDL in COUNTER_TRIGGERS.items():
+        if NAME not in EXISTING:
+            CONN.execute(text(DDL))
+            logging.info(f"COUNTER TRIGGER {NAME} CREATED")
+
+
+def ENSURE_COUNTERS(ENGINE):
+    try:
+        with ENGINE.begin() as CONN:
+            INSTALL_COUNTER_TRIGGERS(CONN)
+        return 1
+    except SQLAlchemyError as ERR:
+        logging.error("COUNTER TRIGGER CHECK FAILED")
+        logging.error(ERR)
+        return 0
+
+
+def RECONCILE_COUNTERS(ENGINE):
     """
-    FIX OLD SCHEMA DRIFT
-    - accounts.provider NOT NULL
-    - accounts.auth_method missing
-    - accounts.created_at missing
-    SAFE & IDEMPOTENT
+    Recomputes counters from emails and corrects drifted rows (also the
+    initial backfill). Only the drift is applied (count = count + delta):
+    emails and email_counters are read in one statement snapshot, in which
+    each trigger update is either fully visible or not at all, and a write
+    committed after that snapshot has already moved the live row. So
+    concurrent inserts / deletes are never overwritten.
     """
     try:
         with ENGINE.begin() as CONN:
+            FIXED = CONN.execute(text("""
+                WITH actual AS (
+                    SELECT account_id, category, count(*) AS n
+                    FROM emails
+                    WHERE category IS NOT NULL
+                    GROUP BY account_id, category
+                ),
+                drift AS (
+                    SELECT COALESCE(a.account_id, c.account_id) AS account_id,
+                           COALESCE(a.category, c.category) AS category,
+                           COALESCE(a.n, 0) - COALESCE(c.count, 0) AS delta
+                    FROM actual a
+                    FULL JOIN email_counters c
+                      ON c.account_id = a.account_id AND c.category = a.category
+                )
+                INSERT INTO email_counters (account_id, category, count)
+                SELECT account_id, category, delta FROM drift
+                WHERE delta <> 0
+                ON CONFLICT (account_id, category)
+                DO UPDATE SET count = email_counters.count + EXCLUDED.count;
+            """)).rowcount
 
-            #==========================AUTH_METHOD
-            CONN.execute(text("""
-                ALTER TABLE accounts
-                ADD COLUMN IF NOT EXISTS auth_method VARCHAR(32) DEFAULT 'imap';
-            """))
+        logging.info(f"EMAIL COUNTERS RECONCILED (FIXED {FIXED})")
+        return 1
+    except SQLAlchemyError as ERR:
+        logging.error("COUNTER RECONCILE FAILED")
+        logging.error(ERR)
+        return 0
 
-            #==========================PROVIDER (OLD SCHEMA COMPAT)
-            CONN.execute(text("""
-                ALTER TABLE accounts
-                ADD COLUMN IF NOT EXISTS provider VARCHAR(32);
-            """))
 
-            CONN.execute(text("""
-                UPDATE accounts
-                SET provider = auth_method
-                WHERE provider IS NULL;
-            """))
+#==========================API CACHE INVALIDATION (DELETES)
+# one NOTIFY per account of the rows in "d", sent at commit
+_NOTIFY_DELETED = """
+    SELECT account_id, n,
+           pg_notify(:channel, json_build_object('account_id', account_id, 'deleted', true)::text)
+    FROM (SELECT account_id, count(*) AS n FROM d GROUP BY account_id) per;
+"""
+_REDIS = None
 
-            CONN.execute(text("""
-                ALTER TABLE accounts
-                ALTER COLUMN provider SET DEFAULT 'imap';
-            """))
 
-            CONN.execute(text("""
-                ALTER TABLE accounts
-                ALTER COLUMN provider SET NOT NULL;
-            """))
+def _BUMP_CACHE_GENERATION(ACCOUNT_IDS):
+    global _REDIS
+    if not CACHE_REDIS_URL or not ACCOUNT_IDS:
+        return
 
-            #==========================CREATED_AT
-            CONN.execute(text("""
-                ALTER TABLE accounts
-                ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();
-            """))
-            #==========================EMAILS AI COLUMNS
-            CONN.execute(text("""
-                ALTER TABLE emails
-                ADD COLUMN IF NOT EXISTS ai_category VARCHAR(32);
-            """))
+    try:
+        if _REDIS is None:
+            import redis
+            _REDIS = redis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=2)
+        PIPE = _REDIS.pipeline(transaction=False)
+        for ACCOUNT_ID in ACCOUNT_IDS:
+            PIPE.incr(f"mailreader:gen:{ACCOUNT_ID}")
+        PIPE.execute()
+    except Exception as ERR:
+        # entries of those accounts stay served until the API's RESPONSE_CACHE_TTL
+        logging.warning(f"CACHE GENERATION BUMP FAILED: {ERR}")
 
-            CONN.execute(text("""
-                ALTER TABLE emails
-                ADD COLUMN IF NOT EXISTS ai_confidence FLOAT;
-            """))
 
-            CONN.execute(text("""
-                ALTER TABLE emails
-                ADD COLUMN IF NOT EXISTS ai_summary TEXT;
-            """))
+#==========================PARTITIONED EMAILS
+# emails PARTITION BY RANGE (expires_at), one partition per UTC day:
+#   emails_YYYYMMDD  FOR VALUES FROM ('YYYY-MM-DD') TO ('YYYY-MM-DD' + 1 day)
+# retention = detach + drop whole days instead of DELETE (no dead tuples)
+def IS_PARTITIONED(CONN, TABLE="emails"):
+    return CONN.execute(text("""
+        SELECT relkind = 'p' FROM pg_class
+        WHERE relname = :t AND relnamespace = 'public'::regnamespace;
+    """), {"t": TABLE}).scalar() is True
 
-            CONN.execute(text("""
-                ALTER TABLE emails
-                ADD COLUMN IF NOT EXISTS ai_model VARCHAR(128);
-            """))
 
-            CONN.execute(text("""
-                ALTER TABLE emails
-                ADD COLUMN IF NOT EXISTS matched_rule VARCHAR(128);
-            """))
+def _EXISTING_RELATIONS(CONN, NAMES):
+    return set(CONN.execute(text("""
+        SELECT relname FROM pg_class
+        WHERE relname = ANY(:names) AND relnamespace = 'public'::regnamespace;
+    """), {"names": NAMES}).scalars().all())
 
-            CONN.execute(text("""
-                ALTER TABLE emails
-                ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();
-            """))
 
-        logging.info("DB SCHEMA DRIFT FIXED")
+def _PARTITION_NAME(DAY):
+    return f"emails_{DAY:%Y%m%d}"
+
+
+def _PARTITION_DAY(NAME):
+    try:
+        return datetime.strptime(NAME[len("emails_"):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def _CREATE_PARTITIONS(CONN, PARENT, FIRST_DAY, LAST_DAY):
+    """
+    Creates the missing daily partitions of PARENT in [FIRST_DAY, LAST_DAY].
+    Existing ones are skipped without touching PARENT (no lock taken).
+    """
+    DAYS = [FIRST_DAY + timedelta(days=N) for N in range((LAST_DAY - FIRST_DAY).days + 1)]
+    EXISTING = _EXISTING_RELATIONS(CONN, [_PARTITION_NAME(D) for D in DAYS])
+    CREATED = 0
+
+    for DAY in DAYS:
+        NAME = _PARTITION_NAME(DAY)
+        if NAME in EXISTING:
+            continue
+        CONN.execute(text(f"""
+            CREATE TABLE {NAME} PARTITION OF {PARENT}
+            FOR VALUES FROM ('{DAY.isoformat()}') TO ('{(DAY + timedelta(days=1)).isoformat()}');
+        """))
+        CREATED += 1
+
+    return CREATED
+
+
+def _TODAY():
+    return datetime.utcnow().date()
+
+
+def ENSURE_PARTITIONS(ENGINE):
+    """
+    Keeps RETENTION_DAYS + PARTITION_PREMAKE_DAYS of future partitions ready
+    (the worker writes expires_at = now + RETENTION_DAYS; both read
+    RETENTION_DAYS from the mailreader-config ConfigMap). There is no DEFAULT
+    partition: it would block DETACH CONCURRENTLY and make every new
+    partition scan it.
+    """
+    try:
+        with ENGINE.connect() as CONN:
+            if not IS_PARTITIONED(CONN):
+                return 1
+
+        CREATED = 0
+        for N in range(RETENTION_DAYS + PARTITION_PREMAKE_DAYS + 1):
+            DAY = _TODAY() + timedelta(days=N)
+            # one short transaction per day: CREATE ... PARTITION OF locks
+            # emails, so give up (retry next loop) instead of queueing
+            # behind long reads and blocking everything behind it
+            with ENGINE.begin() as CONN:
+                CONN.execute(text(f"SET LOCAL lock_timeout = '{MIGRATION_LOCK_TIMEOUT}';"))
+                CREATED += _CREATE_PARTITIONS(CONN, "emails", DAY, DAY)
+        if CREATED:
+            logging.info(f"EMAIL PARTITIONS: {CREATED} CREATED")
+        return 1
+    except SQLAlchemyError as ERR:
+        logging.error("PARTITION CHECK FAILED")
+        logging.error(ERR)
+        return 0
+
+
+def _ATTACHED_PARTITIONS(CONN):
+    """
+    name -> detach pending (an interrupted DETACH ... CONCURRENTLY)
+    """
+    return dict(CONN.execute(text("""
+        SELECT c.relname, i.inhdetachpending
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'emails'::regclass;
+    """)).all())
+
+
+def _DETACHED_LEFTOVERS(CONN):
+    """
+    emails_YYYYMMDD tables no longer attached: detached but not yet dropped.
+    """
+    return set(CONN.execute(text("""
+        SELECT c.relname FROM pg_class c
+        WHERE c.relnamespace = 'public'::regnamespace
+          AND c.relkind = 'r'
+          AND c.relname ~ '^emails_[0-9]{8}$'
+          AND NOT c.relispartition;
+    """)).scalars().all())
+
+
+def DROP_EXPIRED_PARTITIONS(ENGINE):
+    """
+    A partition whose whole day lies before now() only holds expired rows:
+      1. DETACH PARTITION CONCURRENTLY (no ACCESS EXCLUSIVE on emails)
+      2. one transaction: subtract its rows from email_counters, NOTIFY the
+       API of the affected accounts + DROP TABLE
+    DROP fires no DELETE trigger, hence step 2. A crash between 1 and 2
+    leaves a detached table that the next run finishes.
+    """
+    try:
+        with ENGINE.connect().execution_options(isolation_level="AUTOCOMMIT") as CONN:
+            if not IS_PARTITIONED(CONN):
+                return 1
+
+            for NAME, PENDING in sorted(_ATTACHED_PARTITIONS(CONN).items()):
+                DAY = _PARTITION_DAY(NAME)
+                if DAY is None or DAY + timedelta(days=1) > _TODAY():
+                    continue
+                if PENDING:
+                    CONN.execute(text(f"ALTER TABLE emails DETACH PARTITION {NAME} FINALIZE;"))
+                else:
+                    CONN.execute(text(f"ALTER TABLE emails DETACH PARTITION {NAME} CONCURRENTLY;"))
+                logging.info(f"EMAIL PARTITION {NAME} DETACHED")
+
+            LEFTOVERS = sorted(_DETACHED_LEFTOVERS(CONN))
+
+        for NAME in LEFTOVERS:
+            with ENGINE.begin() as CONN:
+                ACCOUNTS = [
+                    str(ROW.account_id) for ROW in CONN.execute(
+                        text(f"WITH d AS (SELECT account_id FROM {NAME})" + _NOTIFY_DELETED),
+                        {"channel": NOTIFY_CHANNEL},
+                    )
+                ]
+                CONN.execute(text(f"""
+                    UPDATE email_counters c
+                    SET count = GREATEST(c.count - d.n, 0)
+                    FROM (
+                        SELECT account_id, category, count(*) AS n
+                        FROM {NAME}
+                        GROUP BY account_id, category
+                    ) d
+                    WHERE c.account_id = d.account_id AND c.category = d.category;
+                """))
+                CONN.execute(text(f"DROP TABLE {NAME};"))
+            _BUMP_CACHE_GENERATION(ACCOUNTS)
+            logging.info(f"EMAIL PARTITION {NAME} DROPPED (RETENTION)")
+
+        return 1
+    except SQLAlchemyError as ERR:
+        logging.error("PARTITION RETENTION FAILED")
+        logging.error(ERR)
+        return 0
+
+
+#==========================ONLINE MIGRATION: emails -> partitioned emails
+# 1. build emails_p (same columns, PK (id, expires_at), planned indexes)
+# 2. copy in keyset batches on (received_at, id) while the worker keeps writing
+# 3. short transaction: LOCK emails (reads still allowed), copy the tail,
+#    drop the old table, rename emails_p -> emails, re-install counter triggers
+# resumable: a restart continues from the newest row already in emails_p
+def _EMAIL_COLUMNS(CONN):
+    return CONN.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'emails'
+        ORDER BY ordinal_position;
+    """)).scalars().all()
+
+
+def _COPY_SQL(COLUMNS, WHERE, LIMIT=""):
+    """
+    Copies the next rows (received_at, id order) into emails_p and returns
+    (rows read, last received_at, last id) of the SOURCE rows, so rows that
+    were already copied do not stop the loop.
+    Rows without expires_at get received_at + RETENTION_DAYS (partition key
+    must not be NULL).
+    """
+    TARGET = ", ".join(COLUMNS)
+    SOURCE = ", ".join(
+        f"COALESCE(expires_at, received_at + interval '{RETENTION_DAYS} days', now() AT TIME ZONE 'UTC') AS expires_at"
+        if COL == "expires_at" else COL
+        for COL in COLUMNS
+    )
+    return f"""
+        WITH src AS (
+            SELECT {SOURCE} FROM emails
+            WHERE {WHERE}
+            ORDER BY received_at, id
+            {LIMIT}
+        ), ins AS (
+            INSERT INTO emails_p ({TARGET})
+            SELECT * FROM src
+            ON CONFLICT DO NOTHING
+        )
+        SELECT count(*), max(received_at),
+               (array_agg(id ORDER BY received_at DESC NULLS LAST, id DESC))[1]
+        FROM src;
+    """
+
+
+#==========================INDEXES ONLY THE PARTITIONED emails NEEDS
+# ix_emails_account_message: worker dedup probe (no unique index possible)
+# ix_emails_received_at: migration keyset / resume point
+PARTITIONED_INDEXES = {
+    "ix_emails_account_message": """
+        CREATE INDEX IF NOT EXISTS ix_emails_account_message
+        ON emails (account_id, message_id);
+    """,
+    "ix_emails_received_at": """
+        CREATE INDEX IF NOT EXISTS ix_emails_received_at
+        ON emails (received_at, id);
+    """,
+}
+
+
+def _BUILD_PARTITIONED_COPY(CONN):
+    CONN.execute(text("""
+        CREATE TABLE emails_p (LIKE emails INCLUDING DEFAULTS)
+        PARTITION BY RANGE (expires_at);
+    """))
+    CONN.execute(text("ALTER TABLE emails_p ALTER COLUMN expires_at SET NOT NULL;"))
+    CONN.execute(text("ALTER TABLE emails_p ADD CONSTRAINT emails_p_pkey PRIMARY KEY (id, expires_at);"))
+    CONN.execute(text("""
+        ALTER TABLE emails_p ADD CONSTRAINT emails_p_account_id_fkey
+        FOREIGN KEY (account_id) REFERENCES accounts (id) ON DELETE CASCADE;
+    """))
+
+    # planned indexes, suffixed until the old table (holding the names) is gone
+    for NAME, DDL in {**EMAIL_INDEXES, **PARTITIONED_INDEXES}.items():
+        CONN.execute(text(
+            DDL.replace("CONCURRENTLY ", "").replace(f" {NAME}", f" {NAME}_p", 1).replace(" ON emails ", " ON emails_p ")
+        ))
+
+    # every day that already holds rows, through the premake horizon
+    FIRST, LAST = CONN.execute(text("""
+        SELECT min(k)::date, max(k)::date FROM (
+            SELECT COALESCE(expires_at, received_at + make_interval(days => :days)) AS k FROM emails
+        ) t;
+    """), {"days": RETENTION_DAYS}).one()
+    HORIZON = _TODAY() + timedelta(days=RETENTION_DAYS + PARTITION_PREMAKE_DAYS)
+    _CREATE_PARTITIONS(CONN, "emails_p", min(FIRST or _TODAY(), _TODAY()), max(LAST or HORIZON, HORIZON))
+
+
+def MIGRATE_TO_PARTITIONED(ENGINE):
+    try:
+        with ENGINE.begin() as CONN:
+            if IS_PARTITIONED(CONN):
+                return 1
+            if not _EXISTING_RELATIONS(CONN, ["emails_p"]):
+                logging.info("EMAILS PARTITION MIGRATION: BUILDING emails_p")
+                _BUILD_PARTITIONED_COPY(CONN)
+            COLUMNS = _EMAIL_COLUMNS(CONN)
+            WATERMARK = CONN.execute(text("""
+                SELECT received_at, id FROM emails_p
+                ORDER BY received_at DESC NULLS LAST, id DESC LIMIT 1;
+            """)).first()
+
+        #==========================BATCH COPY (ONLINE)
+        COPIED = 0
+        BATCHES = 0
+        while True:
+            if WATERMARK is None:
+                SQL, PARAMS = _COPY_SQL(COLUMNS, "received_at IS NOT NULL", "LIMIT :batch"), {}
+            else:
+                SQL = _COPY_SQL(COLUMNS, "(received_at, id) > (:ts, :id)", "LIMIT :batch")
+                PARAMS = {"ts": WATERMARK[0], "id": WATERMARK[1]}
+
+            with ENGINE.begin() as CONN:
+                N, LAST_TS, LAST_ID = CONN.execute(text(SQL), {**PARAMS, "batch": PARTITION_COPY_BATCH}).one()
+
+            if not N:
+                break
+            COPIED += N
+            BATCHES += 1
+            WATERMARK = (LAST_TS, LAST_ID)
+            if BATCHES % 20 == 0:
+                logging.info(f"EMAILS PARTITION MIGRATION: {COPIED} ROWS COPIED")
+
+        #==========================SWAP
+        with ENGINE.begin() as CONN:
+            CONN.execute(text("SET LOCAL lock_timeout = '30s';"))
+            # EXCLUSIVE: readers go on, writers wait for the swap
+            CONN.execute(text("LOCK TABLE emails IN EXCLUSIVE MODE;"))
+
+            # tail written since the last batch (+ a margin for rows committed
+            # late) and rows without received_at, which the keyset skips
+            if WATERMARK is None:
+                TAIL = CONN.execute(text(_COPY_SQL(COLUMNS, "TRUE"))).one()[0]
+            else:
+                TAIL = CONN.execute(
+                    text(_COPY_SQL(COLUMNS, "received_at >= CAST(:ts AS timestamp) - interval '1 hour' OR received_at IS NULL")),
+                    {"ts": WATERMARK[0]},
+                ).one()[0]
+
+            CONN.execute(text("DROP TABLE emails;"))
+            CONN.execute(text("ALTER TABLE emails_p RENAME TO emails;"))
+            CONN.execute(text("ALTER TABLE emails RENAME CONSTRAINT emails_p_pkey TO emails_pkey;"))
+            CONN.execute(text("ALTER TABLE emails RENAME CONSTRAINT emails_p_account_id_fkey TO emails_account_id_fkey;"))
+            for NAME in {**EMAIL_INDEXES, **PARTITIONED_INDEXES}:
+                CONN.execute(text(f"ALTER INDEX {NAME}_p RENAME TO {NAME};"))
+            INSTALL_COUNTER_TRIGGERS(CONN)
+
+        logging.info(f"EMAILS PARTITION MIGRATION: DONE ({COPIED} ROWS COPIED, {TAIL} RECHECKED IN SWAP)")
+        return 1
+
+    except SQLAlchemyError as ERR:
+        logging.error("EMAILS PARTITION MIGRATION FAILED")
+        logging.error(ERR)
+        return 0
+
+
+#==========================RETENTION (BATCHED, SELF-THROTTLING)
+# replaces the CronJob's single "DELETE FROM emails WHERE expires_at < now()":
+# short transactions of RETENTION_BATCH rows, sized so each one takes about
+# RETENTION_TARGET_MS; counters follow through the delete trigger
+RETENTION_BATCH = max(RETENTION_BATCH_MIN, min(1000, RETENTION_BATCH_MAX))
+
+
+def _RETENTION_BACKLOG(CONN):
+    return CONN.execute(text("""
+        SELECT count(*) FROM (
+            SELECT 1 FROM emails WHERE expires_at < NOW() LIMIT :cap
+        ) t;
+    """), {"cap": RETENTION_BACKLOG_CAP}).scalar()
+
+
+def DELETE_EXPIRED_EMAILS(ENGINE):
+    """
+    Deletes expired rows batch by batch for at most RETENTION_BUDGET seconds.
+    Plain table only: a partitioned emails keeps rows until their whole day
+    has expired and DROP_EXPIRED_PARTITIONS drops it (no dead tuples).
+    The inner SELECT walks ix_emails_expires_at. Each batch NOTIFYs the API
+    of the accounts it touched (response cache invalidation).
+    The batch size adapts: scaled by target/observed latency (x0.5 .. x2)
+    and halved after a lock timeout. Logs rows/sec and the backlog left.
+    """
+    global RETENTION_BATCH
+
+    STARTED = time.monotonic()
+    DELETED = 0
+    try:
+        with ENGINE.connect() as CONN:
+            if IS_PARTITIONED(CONN):
+                return 1
+
+        while time.monotonic() - STARTED < RETENTION_BUDGET:
+            T0 = time.monotonic()
+            try:
+                with ENGINE.begin() as CONN:
+                    CONN.execute(text("SET LOCAL lock_timeout = '2s';"))
+                    ROWS = CONN.execute(text("""
+                        WITH d AS (
+                            DELETE FROM emails
+                            WHERE (id, expires_at) IN (
+                                SELECT id, expires_at FROM emails
+                                WHERE expires_at < NOW()
+                                LIMIT :n
+                            )
+                            RETURNING account_id
+                        )
+                    """ + _NOTIFY_DELETED), {"n": RETENTION_BATCH, "channel": NOTIFY_CHANNEL}).all()
+                N = sum(ROW.n for ROW in ROWS)
+            except OperationalError as ERR:
+                # lock_timeout: back off instead of queueing behind writers
+                logging.warning(f"RETENTION BATCH SKIPPED: {ERR.orig}")
+                RETENTION_BATCH = max(RETENTION_BATCH_MIN, RETENTION_BATCH // 2)
+                time.sleep(1)
+                continue
+
+            ELAPSED_MS = max((time.monotonic() - T0) * 1000, 1.0)
+            _BUMP_CACHE_GENERATION([str(ROW.account_id) for ROW in ROWS])
+            DELETED += N
+            if N < RETENTION_BATCH:
+                break
+
+            SCALE = min(2.0, max(0.5, RETENTION_TARGET_MS / ELAPSED_MS))
+            RETENTION_BATCH = int(min(RETENTION_BATCH_MAX, max(RETENTION_BATCH_MIN, RETENTION_BATCH * SCALE)))
+            time.sleep(RETENTION_PAUSE_MS / 1000)
+
+        with ENGINE.connect() as CONN:
+            BACKLOG = _RETENTION_BACKLOG(CONN)
+
+        SECONDS = time.monotonic() - STARTED
+        if DELETED or BACKLOG:
+            logging.info(
+                f"RETENTION: {DELETED} ROWS DELETED IN {SECONDS:.1f}s "
+                f"({DELETED / SECONDS:.0f} ROWS/S, BATCH {RETENTION_BATCH}), "
+                f"BACKLOG {BACKLOG}{'+' if BACKLOG >= RETENTION_BACKLOG_CAP else ''}"
+            )
         return 1
+    except SQLAlchemyError as ERR:
+        logging.error("RETENTION FAILED")
+        logging.error(ERR)
+        return 0
+
 
+def CLEAN_CLASSIFICATION_CACHE(ENGINE):
+    try:
+        with ENGINE.begin() as CONN:
+            RES = CONN.execute(text("""
+                DELETE FROM classification_cache
+                WHERE expires_at < NOW();
+            """))
+        if RES.rowcount:
+            logging.info(f"CLASSIFICATION CACHE: {RES.rowcount} EXPIRED ROWS REMOVED")
+        return 1
+    except SQLAlchemyError as ERR:
+        logging.error("CLASSIFICATION CACHE CLEANUP FAILED")
+        logging.error(ERR)
+        return 0
+
+
+#==========================CONFIG VERSION (WORKER SNAPSHOT INVALIDATION)
+# one counter row bumped by statement-level triggers on every write to the
+# tables the worker snapshots; the worker re-reads them only when it moves
+CONFIG_VERSION_TABLES = ["accounts", "secrets", "rules"]
+
+CONFIG_VERSION = [
+    """
+    CREATE TABLE IF NOT EXISTS config_version (
+        id      SMALLINT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    );
+    """,
+    "INSERT INTO config_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;",
+    """
+    CREATE OR REPLACE FUNCTION bump_config_version() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE config_version SET version = version + 1 WHERE id = 1;
+        RETURN NULL;
+    END $$;
+    """,
+] + [
+    f"""
+    CREATE OR REPLACE TRIGGER trg_config_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {TABLE}
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_config_version();
+    """
+    for TABLE in CONFIG_VERSION_TABLES
+]
+
+
+#==========================VERSIONED MIGRATIONS
+# (version, name, step): step is a list of SQL statements (one transaction,
+# ledger row included) or an idempotent ENSURE_* function returning 1/0 that
+# manages its own transactions (CONCURRENTLY), with its DDL in STEP_DDL.
+# Append only: an applied migration must never change, its checksum is
+# verified on every start.
+MIGRATIONS = [
+    (1, "baseline tables", ENSURE_TABLES),
+    (2, "accounts legacy columns", ACCOUNTS_LEGACY_COLUMNS),
+    (3, "emails ai columns", EMAILS_AI_COLUMNS),
+    (4, "emails dedup index", ENSURE_DEDUP_INDEX),
+    (5, "sync_state graph delta link", SYNC_STATE_DELTA_LINK),
+    (6, "emails index plan", ENSURE_INDEXES),
+    (7, "email counter triggers", ENSURE_COUNTERS),
+    (8, "config version triggers", CONFIG_VERSION),
+]
+
+# the DDL each ENSURE_* step applies; its checksum is taken over this, not
+# over the function, so logging / control flow edits do not count and a
+# changed model, index or trigger does
+STEP_DDL = {
+    ENSURE_TABLES: _BASELINE_DDL,
+    ENSURE_DEDUP_INDEX: lambda: [DEDUP_INDEX],
+    ENSURE_INDEXES: lambda: list(EMAIL_INDEXES.values()) + list(PARTITIONED_INDEXES.values()),
+    ENSURE_COUNTERS: lambda: COUNTER_FUNCTIONS + list(COUNTER_TRIGGERS.values()),
+}
+
+
+def _CHECKSUM(STEP):
+    RAW = "\n".join(STEP if isinstance(STEP, list) else STEP_DDL[STEP]())
+    return hashlib.sha256(RAW.encode("utf-8")).hexdigest()
+
+
+def _LEDGER(CONN):
+    CONN.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version     INTEGER PRIMARY KEY,
+            name        VARCHAR(128) NOT NULL,
+            checksum    VARCHAR(64) NOT NULL,
+            applied_at  TIMESTAMP NOT NULL DEFAULT NOW(),
+            duration_ms INTEGER NOT NULL
+        );
+    """))
+    return dict(CONN.execute(text("SELECT version, checksum FROM schema_migrations;")).all())
+
+
+def APPLY_MIGRATIONS(ENGINE):
+    """
+    Applies pending MIGRATIONS once, in order, under a session advisory lock.
+    DDL runs with lock_timeout = MIGRATION_LOCK_TIMEOUT: on a busy table it
+    fails fast and the whole run is retried on the next loop.
+    """
+    # same database, every session starts with the lock timeout
+    MIGRATION_ENGINE = create_engine(
+        ENGINE.url,
+        pool_pre_ping=True,
+        connect_args={"options": f"-c lock_timeout={MIGRATION_LOCK_TIMEOUT}"}
+    )
+    try:
+        with ENGINE.connect().execution_options(isolation_level="AUTOCOMMIT") as LOCK_CONN:
+            if not LOCK_CONN.execute(text("SELECT pg_try_advisory_lock(:k);"), {"k": MIGRATION_ADVISORY_LOCK}).scalar():
+                logging.warning("MIGRATIONS LOCKED BY ANOTHER SESSION, RETRYING NEXT LOOP")
+                return 0
+            try:
+                with MIGRATION_ENGINE.begin() as CONN:
+                    APPLIED = _LEDGER(CONN)
+
+                for VERSION, NAME, STEP in MIGRATIONS:
+                    CHECKSUM = _CHECKSUM(STEP)
+
+                    if VERSION in APPLIED:
+                        if APPLIED[VERSION] != CHECKSUM:
+                            logging.error(f"MIGRATION {VERSION:04d} ({NAME}) CHANGED AFTER IT WAS APPLIED (CHECKSUM MISMATCH)")
+                        continue
+
+                    T0 = time.monotonic()
+                    if isinstance(STEP, list):
+                        with MIGRATION_ENGINE.begin() as CONN:
+                            for SQL in STEP:
+                                CONN.execute(text(SQL))
+                            _RECORD_MIGRATION(CONN, VERSION, NAME, CHECKSUM, T0)
+                    else:
+                        if STEP(MIGRATION_ENGINE) != 1:
+                            logging.error(f"MIGRATION {VERSION:04d} ({NAME}) FAILED")
+                            return 0
+                        with MIGRATION_ENGINE.begin() as CONN:
+                            _RECORD_MIGRATION(CONN, VERSION, NAME, CHECKSUM, T0)
+
+                    logging.info(f"MIGRATION {VERSION:04d} ({NAME}) APPLIED")
+            finally:
+                LOCK_CONN.execute(text("SELECT pg_advisory_unlock(:k);"), {"k": MIGRATION_ADVISORY_LOCK})
+
+        logging.info("SCHEMA MIGRATIONS UP TO DATE")
+        return 1
     except SQLAlchemyError as ERR:
         logging.error("SCHEMA MIGRATION FAILED")
         logging.error(ERR)
         return 0
+    finally:
+        MIGRATION_ENGINE.dispose()
+
+
+def _RECORD_MIGRATION(CONN, VERSION, NAME, CHECKSUM, T0):
+    CONN.execute(text("""
+        INSERT INTO schema_migrations (version, name, checksum, duration_ms)
+        VALUES (:v, :n, :c, :d);
+    """), {"v": VERSION, "n": NAME, "c": CHECKSUM, "d": int((time.monotonic() - T0) * 1000)})
+
+
+#==========================DRIFT CHECK (READ-ONLY, EVERY LOOP)
+def CHECK_SCHEMA_DRIFT(ENGINE):
+    """
+    Catalog reads only, no DDL and no table locks: model tables and columns,
+    planned email indexes (present and valid), counter and config version triggers.
+    Drift is reported; fixing it is a new migration.
+    """
+    try:
+        DRIFT = []
+        with ENGINE.connect() as CONN:
+            COLUMNS = {}
+            for TABLE, COLUMN in CONN.execute(text("""
+                SELECT table_name, column_name FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = ANY(:tables);
+            """), {"tables": list(Base.metadata.tables)}).all():
+                COLUMNS.setdefault(TABLE, set()).add(COLUMN)
+
+            for TABLE in Base.metadata.sorted_tables:
+                if TABLE.name not in COLUMNS:
+                    DRIFT.append(f"table {TABLE.name} missing")
+                    continue
+                for COLUMN in TABLE.columns:
+                    if COLUMN.name not in COLUMNS[TABLE.name]:
+                        DRIFT.append(f"column {TABLE.name}.{COLUMN.name} missing")
+
+            PLANNED = dict(EMAIL_INDEXES)
+            if IS_PARTITIONED(CONN):
+                PLANNED.update(PARTITIONED_INDEXES)
+            VALID = dict(CONN.execute(text("""
+                SELECT c.relname, i.indisvalid
+                FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = ANY(:names);
+            """), {"names": list(PLANNED)}).all())
+            for NAME in PLANNED:
+                if NAME not in VALID:
+                    DRIFT.append(f"index {NAME} missing")
+                elif not VALID[NAME]:
+                    DRIFT.append(f"index {NAME} invalid")
+
+            TRIGGERS = set(CONN.execute(text("""
+                SELECT tgname FROM pg_trigger
+                WHERE tgrelid = 'emails'::regclass AND NOT tgisinternal;
+            """)).scalars().all())
+            for NAME in COUNTER_TRIGGERS:
+                if NAME not in TRIGGERS:
+                    DRIFT.append(f"trigger {NAME} missing")
+
+            VERSIONED = set(CONN.execute(text("""
+                SELECT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid
+                WHERE t.tgname = 'trg_config_version';
+            """)).scalars().all())
+            for TABLE in CONFIG_VERSION_TABLES:
+                if TABLE not in VERSIONED:
+                    DRIFT.append(f"trigger trg_config_version on {TABLE} missing")
+
+        for ITEM in DRIFT:
+            logging.warning(f"SCHEMA DRIFT: {ITEM}")
+        return 0 if DRIFT else 1
+    except SQLAlchemyError as ERR:
+        logging.error("SCHEMA DRIFT CHECK FAILED")
+        logging.error(ERR)
+        return 0
 
 
 def DB_CONTROLLER_SERVICE():
     INTRO()
     ENGINE = CREATE_ENGINE()
+    MIGRATED = False
+    PENDING_SINCE = time.time()
+    NEXT_RECONCILE = 0.0
 
     while True:
-        T_STATE = ENSURE_TABLES(ENGINE)
-        C_STATE = ENSURE_COLUMNS(ENGINE)
+        # DDL only until the ledger is up to date; afterwards catalog reads
+        if not MIGRATED:
+            MIGRATED = APPLY_MIGRATIONS(ENGINE) == 1
+            if not MIGRATED:
+                logging.error(
+                    f"DB SCHEMA STATE: MIGRATIONS PENDING FOR {(time.time() - PENDING_SINCE) / 60:.0f} MIN "
+                    f"(PARTITIONS, COUNTERS AND RETENTION KEEP RUNNING)"
+                )
+
+        # maintenance does not wait for the ledger: a migration that keeps
+        # failing must not stop partition upkeep or retention
+        P_STATE = MIGRATE_TO_PARTITIONED(ENGINE) if EMAILS_PARTITIONED and MIGRATED else 1
+        if P_STATE == 1:
+            P_STATE = ENSURE_PARTITIONS(ENGINE)
+
+        if time.time() >= NEXT_RECONCILE:
+            if RECONCILE_COUNTERS(ENGINE) == 1:
+                NEXT_RECONCILE = time.time() + COUNTER_RECONCILE_INTERVAL
+
+        DROP_EXPIRED_PARTITIONS(ENGINE)
+        if RETENTION_ENABLED:
+            DELETE_EXPIRED_EMAILS(ENGINE)
+
+        if MIGRATED:
+            D_STATE = CHECK_SCHEMA_DRIFT(ENGINE)
+
+            if P_STATE == 1 and D_STATE == 1:
+                logging.info("DB SCHEMA STATE: OK")
+            else:
+                logging.error("DB SCHEMA STATE: DRIFT / ERROR")
 
-        if T_STATE == 1 and C_STATE == 1:
-            logging.info("DB SCHEMA STATE: OK")
-        else:
-            logging.error("DB SCHEMA STATE: ERROR")
+        CLEAN_CLASSIFICATION_CACHE(ENGINE)
 
         time.sleep(CHECK_INTERVAL)
 
@@ -1,153 +1,234 @@
 import os
-import requests
+import httpx
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, Response, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.static_assets import Asset, IMMUTABLE, REVALIDATE, load_static, rewrite_static_refs
 
 MAILREADER_API_URL = os.environ.get(
     "MAILREADER_API_URL",
     "http://skylight-engineer-mailreader-api:8000"
 )
 
+# keep-alive pool towards the API
+# HTTP/2 is negotiated over TLS only (uvicorn itself speaks HTTP/1.1), so
+# API_HTTP2 matters when MAILREADER_API_URL points at an https ingress
+API_HTTP2 = os.environ.get("API_HTTP2", "false").strip().lower() in ("1", "true", "yes")
+API_MAX_CONNECTIONS = int(os.environ.get("API_MAX_CONNECTIONS", "100"))
+API_MAX_KEEPALIVE = int(os.environ.get("API_MAX_KEEPALIVE", "20"))
+
 app = FastAPI(title="Skylight Engineer MailReader UI")
 
+# created on startup, shared by every handler
+http: httpx.AsyncClient | None = None
+
+
+@app.on_event("startup")
+async def on_startup():
+    global http
+    http = httpx.AsyncClient(
+        base_url=MAILREADER_API_URL,
+        http2=API_HTTP2,
+        limits=httpx.Limits(
+            max_connections=API_MAX_CONNECTIONS,
+            max_keepalive_connections=API_MAX_KEEPALIVE,
+        ),
+        timeout=10,
+    )
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await http.aclose()
+
 # =========================
 # STATIC UI
 # =========================
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-
-@app.get("/", response_class=HTMLResponse)
-def index():
-    with open("static/index.html", "r", encoding="utf-8") as f:
-        return f.read()
+# everything is read, hashed and compressed once at startup; no disk I/O per request
+STATIC_DIR = "static"
+STATIC = load_static(STATIC_DIR)
 
 
 # =========================
 # ENV → JS (RUNTIME)
 # =========================
-@app.get("/env.js")
-def env_js():
-    js = """
+ENV_JS = Asset(b"""
     window.RUNTIME_CONFIG = {
         API_BASE: ""
     };
-    """
-    return Response(js, media_type="application/javascript")
+    """, "application/javascript; charset=utf-8")
+
+INDEX = Asset(
+    rewrite_static_refs(STATIC["index.html"].variants[None].decode("utf-8"), STATIC, ENV_JS).encode("utf-8"),
+    "text/html; charset=utf-8"
+)
+
+
+@app.get("/")
+def index(req: Request):
+    # the HTML revalidates (cheap 304); what it references is content-hashed
+    return INDEX.response(req, REVALIDATE)
+
+
+@app.get("/env.js")
+def env_js(req: Request, v: str | None = None):
+    return ENV_JS.response(req, IMMUTABLE if v == ENV_JS.digest else REVALIDATE)
+
+
+@app.get("/assets/{digest}/{path:path}")
+def hashed_asset(req: Request, digest: str, path: str):
+    asset = STATIC.get(path)
+    if asset is None:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    # an old digest still gets the current file, just not cached for good
+    return asset.response(req, IMMUTABLE if digest == asset.digest else REVALIDATE)
+
+
+@app.get("/static/{path:path}")
+def static_asset(req: Request, path: str):
+    asset = STATIC.get(path)
+    if asset is None:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    return asset.response(req, REVALIDATE)
 
 
 # =========================
 # BFF – API PASSTHROUGH
 # =========================
 
-def proxy_response(r: requests.Response):
+# request headers sent on to the API / response headers sent back unchanged
+FORWARD_REQUEST_HEADERS = (
+    "accept", "accept-encoding", "content-type",
+    "if-none-match", "if-modified-since",
+)
+FORWARD_RESPONSE_HEADERS = (
+    "content-type", "content-encoding", "content-length",
+    "etag", "last-modified", "cache-control", "vary", "x-accel-buffering",
+)
+
+
+async def passthrough(req: Request, path: str, params: dict | None = None, timeout=httpx.USE_CLIENT_DEFAULT):
     """
-    Ortak response handler
+    Ortak proxy
+    Status, body bytes (still encoded) and the headers above are streamed
+    through as they arrive; nothing is parsed. Only a non-JSON error body
+    is wrapped as {"detail": ...} so the UI always gets JSON on failure.
     """
-    try:
-        return JSONResponse(
-            status_code=r.status_code,
-            content=r.json()
-        )
-    except Exception:
+    upstream = http.build_request(
+        req.method,
+        path,
+        params=params,
+        headers={k: v for k, v in req.headers.items() if k in FORWARD_REQUEST_HEADERS},
+        content=await req.body() or None,
+        timeout=timeout
+    )
+    r = await http.send(upstream, stream=True)
+
+    content_type = r.headers.get("content-type", "")
+    if r.status_code >= 400 and not content_type.startswith("application/json"):
+        try:
+            await r.aread()
+        finally:
+            await r.aclose()
         return JSONResponse(
             status_code=r.status_code,
             content={"detail": r.text}
         )
 
+    async def relay():
+        try:
+            async for chunk in r.aiter_raw():
+                yield chunk
+        finally:
+            await r.aclose()
+
+    return StreamingResponse(
+        relay(),
+        status_code=r.status_code,
+        headers={k: v for k, v in r.headers.items() if k in FORWARD_RESPONSE_HEADERS}
+    )
+
 
 # -------- ACCOUNTS --------
 
 @app.get("/accounts")
-def get_accounts():
-    r = requests.get(f"{MAILREADER_API_URL}/accounts", timeout=10)
-    return proxy_response(r)
+async def get_accounts(req: Request):
+    return await passthrough(req, "/accounts")
 
 @app.delete("/accounts/{account_id}")
-def delete_account(account_id: str):
-    r = requests.delete(
-        f"{MAILREADER_API_URL}/accounts/{account_id}",
-        timeout=10
-    )
-    return proxy_response(r)
+async def delete_account(req: Request, account_id: str):
+    return await passthrough(req, f"/accounts/{account_id}")
 
 @app.post("/accounts/imap")
 async def create_account(req: Request):
-    payload = await req.json()
-    r = requests.post(
-        f"{MAILREADER_API_URL}/accounts/imap",
-        json=payload,
-        timeout=10
-    )
-    return proxy_response(r)
+    return await passthrough(req, "/accounts/imap")
 
 
 # -------- RULES --------
 
 @app.get("/rules")
-def get_rules(account_id: str):
-    r = requests.get(
-        f"{MAILREADER_API_URL}/rules",
-        params={"account_id": account_id},
-        timeout=10
-    )
-    return proxy_response(r)
+async def get_rules(req: Request, account_id: str):
+    return await passthrough(req, "/rules", params={"account_id": account_id})
 
 
 @app.post("/rules")
 async def create_rule(req: Request):
-    payload = await req.json()
-    r = requests.post(
-        f"{MAILREADER_API_URL}/rules",
-        json=payload,
-        timeout=10
-    )
-    return proxy_response(r)
+    return await passthrough(req, "/rules")
 
 
 # -------- EMAILS (🔥 ASIL EKSİK BUYDU) --------
 
 @app.get("/emails")
-def list_emails(
+async def list_emails(
+    req: Request,
     account_id: str,
     category: str | None = None,
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    cursor: str | None = None
 ):
     params = {
         "account_id": account_id,
         "limit": limit,
-        "offset": offset
     }
     if category:
         params["category"] = category
 
-    r = requests.get(
-        f"{MAILREADER_API_URL}/emails",
-        params=params,
-        timeout=15
-    )
-    return proxy_response(r)
+    # keyset mode when the client sends a cursor (empty = first page)
+    if cursor is not None:
+        params["cursor"] = cursor
+    else:
+        params["offset"] = offset
+
+    return await passthrough(req, "/emails", params=params, timeout=15)
 
 
 @app.get("/emails/important")
-def important_emails(account_id: str, limit: int = 20):
-    r = requests.get(
-        f"{MAILREADER_API_URL}/emails/important",
+async def important_emails(req: Request, account_id: str, limit: int = 20):
+    return await passthrough(
+        req,
+        "/emails/important",
         params={
             "account_id": account_id,
             "limit": limit
-        },
-        timeout=10
+        }
     )
-    return proxy_response(r)
 
 
 @app.get("/emails/latest")
-def latest_email(account_id: str):
-    r = requests.get(
-        f"{MAILREADER_API_URL}/emails/latest",
+async def latest_email(req: Request, account_id: str):
+    return await passthrough(req, "/emails/latest", params={"account_id": account_id})
+
+
+@app.get("/emails/stream")
+async def email_stream(req: Request, account_id: str):
+    """
+    SSE passthrough: chunks are forwarded as they arrive, never buffered
+    (the API sets Cache-Control: no-cache and X-Accel-Buffering: no).
+    """
+    return await passthrough(
+        req,
+        "/emails/stream",
         params={"account_id": account_id},
-        timeout=10
+        # no read timeout: the API sends a keepalive comment periodically
+        timeout=httpx.Timeout(10, read=None)
     )
-    return proxy_response(r)
@@ -0,0 +1,112 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# one year; only used on content-hashed URLs
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+MIN_COMPRESS_SIZE = 512
+
+
+class Asset:
+    """
+    One file held in memory with its precompressed variants.
+    Each encoding has its own strong ETag ("<digest>", "<digest>-gz", "<digest>-br").
+    """
+
+    def __init__(self, body: bytes, media_type: str):
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {None: body}
+
+        if len(body) >= MIN_COMPRESS_SIZE:
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < len(body):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < len(body):
+                    self.variants["br"] = br
+
+    def etag(self, encoding: str | None) -> str:
+        suffix = {None: "", "gzip": "-gz", "br": "-br"}[encoding]
+        return f'"{self.digest}{suffix}"'
+
+    def pick_encoding(self, accept_encoding: str) -> str | None:
+        accepted = {p.split(";")[0].strip().lower() for p in accept_encoding.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return None
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        encoding = self.pick_encoding(request.headers.get("accept-encoding", ""))
+        etag = self.etag(encoding)
+
+        headers = {
+            "ETag": etag,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=self.variants[encoding], media_type=self.media_type, headers=headers)
+
+
+def _media_type(path: str) -> str:
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type in ("application/javascript", "application/json"):
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def load_static(directory: str) -> dict:
+    """
+    Reads every file under `directory` once: relative path -> Asset.
+    """
+    assets = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, directory).replace(os.sep, "/")
+            with open(full, "rb") as f:
+                assets[rel] = Asset(f.read(), _media_type(rel))
+    return assets
+
+
+_STATIC_REF = re.compile(r'(src|href)="/static/([^"?#]+)"')
+
+
+def hashed_url(path: str, asset: Asset) -> str:
+    return f"/assets/{asset.digest}/{path}"
+
+
+def rewrite_static_refs(html: str, assets: dict, env_js: Asset) -> str:
+    """
+    Points /static/... references at their content-hashed URL and versions
+    /env.js, so the page can be cached forever except for the HTML itself.
+    """
+    def repl(m):
+        asset = assets.get(m.group(2))
+        if asset is None:
+            return m.group(0)
+        return f'{m.group(1)}="{hashed_url(m.group(2), asset)}"'
+
+    html = _STATIC_REF.sub(repl, html)
+    return html.replace('src="/env.js"', f'src="/env.js?v={env_js.digest}"')
@@ -0,0 +1,122 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from app.db import get_cached_classification, put_cached_classification
+
+# ========================== CONFIG ==========================
+CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "10000"))
+CLASSIFY_CACHE_TTL = int(os.getenv("CLASSIFY_CACHE_TTL", "86400"))
+CLASSIFY_CACHE_SHARED = os.getenv("CLASSIFY_CACHE_SHARED", "true").strip().lower() in ("1", "true", "yes")
+
+_WS = re.compile(r"\s+")
+
+# content_hash -> (expires_at, (category, confidence, reason))
+_MEMORY = OrderedDict()
+_LOCK = threading.Lock()
+
+_STATS = {
+    "memory_hits": 0,
+    "shared_hits": 0,
+    "misses": 0,
+    "llm_calls": 0,
+    "llm_seconds": 0.0,
+}
+
+
+def _norm(value) -> str:
+    return _WS.sub(" ", str(value or "")).strip().lower()
+
+
+def content_key(mail: dict) -> str:
+    """
+    Hash of the prompt inputs that identify a bulk mail: subject, sender and
+    body (capped like the prompt). The recipient is left out on purpose so
+    one campaign hitting many accounts maps to one entry.
+    """
+    raw = "\x00".join((
+        _norm(mail.get("subject")),
+        _norm(mail.get("from")),
+        _norm((mail.get("body") or "")[:4000]),
+    ))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _remember(key: str, result: tuple, ttl: float):
+    with _LOCK:
+        _MEMORY[key] = (time.monotonic() + ttl, result)
+        _MEMORY.move_to_end(key)
+        while len(_MEMORY) > CLASSIFY_CACHE_SIZE:
+            _MEMORY.popitem(last=False)
+
+
+def get(key: str) -> tuple | None:
+    """
+    Memory tier first, then the shared Postgres tier.
+    Returns (category, confidence, reason) or None.
+    """
+    with _LOCK:
+        entry = _MEMORY.get(key)
+        if entry and entry[0] > time.monotonic():
+            _MEMORY.move_to_end(key)
+            _STATS["memory_hits"] += 1
+            return entry[1]
+        if entry:
+            del _MEMORY[key]
+
+    if CLASSIFY_CACHE_SHARED:
+        try:
+            row = get_cached_classification(key)
+        except Exception as e:
+            logging.warning(f"CLASSIFY CACHE (shared) READ FAILED: {e}")
+            row = None
+
+        if row:
+            result = (row["category"], int(row["confidence"]), row["reason"])
+            _remember(key, result, min(float(row["ttl"]), CLASSIFY_CACHE_TTL))
+            with _LOCK:
+                _STATS["shared_hits"] += 1
+            return result
+
+    with _LOCK:
+        _STATS["misses"] += 1
+    return None
+
+
+def put(key: str, result: tuple, llm_seconds: float):
+    """
+    Stores a fresh LLM result; llm_seconds feeds the "time saved" estimate.
+    """
+    _remember(key, result, CLASSIFY_CACHE_TTL)
+    with _LOCK:
+        _STATS["llm_calls"] += 1
+        _STATS["llm_seconds"] += llm_seconds
+
+    if CLASSIFY_CACHE_SHARED:
+        try:
+            put_cached_classification(key, result[0], result[1], result[2], CLASSIFY_CACHE_TTL)
+        except Exception as e:
+            logging.warning(f"CLASSIFY CACHE (shared) WRITE FAILED: {e}")
+
+
+def stats() -> dict:
+    """
+    Hit/miss counters since start plus the LLM time the hits saved
+    (estimated from the average observed LLM latency).
+    """
+    with _LOCK:
+        out = dict(_STATS)
+        out["size"] = len(_MEMORY)
+
+    hits = out["memory_hits"] + out["shared_hits"]
+    lookups = hits + out["misses"]
+    avg = out["llm_seconds"] / out["llm_calls"] if out["llm_calls"] else 0.0
+
+    out["hit_ratio"] = round(hits / lookups, 3) if lookups else 0.0
+    out["llm_seconds_saved"] = round(hits * avg, 1)
+    out["llm_seconds"] = round(out["llm_seconds"], 1)
+    return out
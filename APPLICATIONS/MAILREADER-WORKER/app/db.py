@@ -1,45 +1,96 @@
 import os
+import json
 import uuid
+import logging
+import threading
 from sqlalchemy import create_engine, text
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set")
 
+# accounts are processed concurrently (see scheduler.py); keep the pool
+# at least as large as WORKER_CONCURRENCY so threads do not queue on it
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "16")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "8")),
     future=True,
 )
 
-def get_accounts():
+# LISTENed to by the API (app/notifications.py)
+NOTIFY_CHANNEL = "mailreader_emails"
+NOTIFY_MAX_BYTES = 7000  # below Postgres' 8000 byte payload limit
+NOTIFY_TEXT_MAX = 200
+
+# optional: per-account generation of the API's shared response cache
+# (MAILREADER-API app/cache.py), bumped here once per insert
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "").strip()
+_redis = None
+
+# ========================== CONFIG SNAPSHOT ==========================
+# accounts + secrets + enabled rules, reloaded only when config_version
+# (bumped by triggers on accounts / secrets / rules, see DB controller) moves
+_SNAPSHOT = None  # (version, accounts)
+_SNAPSHOT_LOCK = threading.Lock()
+_HAS_CONFIG_VERSION = False
+
+
+def _config_version(c):
     """
-    Returns list of dicts:
-      {id, email, auth_method, enc_payload}
+    None while the DB controller has not created config_version yet
+    (the snapshot is then reloaded every cycle).
     """
-    with engine.connect() as c:
-        rows = c.execute(text("""
-            SELECT a.id, a.email, a.auth_method, s.enc_payload
-            FROM accounts a
-            JOIN secrets s ON s.account_id = a.id
-            ORDER BY a.created_at DESC
-        """)).mappings().all()
-        return [dict(r) for r in rows]
+    global _HAS_CONFIG_VERSION
+    if not _HAS_CONFIG_VERSION:
+        _HAS_CONFIG_VERSION = c.execute(text("SELECT to_regclass('public.config_version') IS NOT NULL")).scalar()
+        if not _HAS_CONFIG_VERSION:
+            return None
+    return c.execute(text("SELECT version FROM config_version WHERE id = 1")).scalar()
 
 
-def get_rules(account_id):
+def get_snapshot() -> list:
     """
     Returns list of dicts:
-      {name, priority, conditions, action, enabled}
+      {id, email, auth_method, enc_payload, rules: [{name, priority, conditions, action, enabled}]}
+    Unchanged config costs one tiny query; a reload is two set-based queries
+    in one REPEATABLE READ transaction instead of 1 + N. Treat as read-only:
+    it is shared until the next change.
     """
-    with engine.connect() as c:
-        rows = c.execute(text("""
-            SELECT name, priority, conditions, action, enabled
-            FROM rules
-            WHERE account_id = :aid AND enabled = true
-            ORDER BY priority DESC
-        """), {"aid": account_id}).mappings().all()
-        return [dict(r) for r in rows]
+    global _SNAPSHOT
+
+    with _SNAPSHOT_LOCK:
+        with engine.connect() as c:
+            version = _config_version(c)
+        if version is not None and _SNAPSHOT and _SNAPSHOT[0] == version:
+            return _SNAPSHOT[1]
+
+        with engine.connect().execution_options(isolation_level="REPEATABLE READ") as c:
+            with c.begin():
+                version = _config_version(c)
+                accounts = [dict(r) for r in c.execute(text("""
+                    SELECT a.id, a.email, a.auth_method, s.enc_payload
+                    FROM accounts a
+                    JOIN secrets s ON s.account_id = a.id
+                    ORDER BY a.created_at DESC
+                """)).mappings().all()]
+                rules = c.execute(text("""
+                    SELECT account_id, name, priority, conditions, action, enabled
+                    FROM rules
+                    WHERE enabled = true
+                    ORDER BY account_id, priority DESC
+                """)).mappings().all()
+
+        by_account = {}
+        for r in rules:
+            rule = dict(r)
+            by_account.setdefault(str(rule.pop("account_id")), []).append(rule)
+        for acc in accounts:
+            acc["rules"] = by_account.get(str(acc["id"]), [])
+
+        _SNAPSHOT = (version, accounts)
+        return accounts
 
 
 def update_secret_payload(account_id, enc_payload: str):
@@ -51,39 +102,263 @@ def update_secret_payload(account_id, enc_payload: str):
         """), {"aid": account_id, "p": enc_payload})
 
 
+def get_all_secrets() -> list:
+    """
+    Returns list of dicts: {account_id, enc_payload}
+    """
+    with engine.connect() as c:
+        rows = c.execute(text("""
+            SELECT account_id, enc_payload FROM secrets
+        """)).mappings().all()
+        return [dict(r) for r in rows]
+
+
+def replace_secret_payload(account_id, old_payload: str, new_payload: str) -> bool:
+    """
+    Compare-and-swap: False if the secret changed meanwhile (e.g. the worker
+    stored a refreshed token), so a concurrent update is never overwritten.
+    """
+    with engine.begin() as c:
+        res = c.execute(text("""
+            UPDATE secrets
+            SET enc_payload = :new
+            WHERE account_id = :aid AND enc_payload = :old
+        """), {"aid": account_id, "old": old_payload, "new": new_payload})
+        return res.rowcount == 1
+
+
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", "500"))
+
+
+def insert_emails(mails: list) -> list:
+    """
+    Set-based, duplicate-safe insert (account_id + message_id) in ONE transaction:
+      INSERT ... SELECT FROM (VALUES (...), (...)) WHERE NOT EXISTS ... RETURNING
+    emails may be range-partitioned by expires_at (DB controller), where no
+    unique index can span (account_id, message_id); the NOT EXISTS probe under
+    a per-account advisory lock is the dedup instead of ON CONFLICT.
+    Returns one bool per input row: True if inserted, False if skipped
+    (empty message_id, duplicate in the batch or already stored).
+    New rows are announced on NOTIFY_CHANNEL at commit (see _notify_inserted).
+    """
+    statuses = [False] * len(mails)
+    positions = {}
+
+    for i, mail in enumerate(mails):
+        if not mail.get("message_id"):
+            continue
+        key = (str(mail["account_id"]), mail["message_id"])
+        positions.setdefault(key, i)
+
+    if not positions:
+        return statuses
+
+    todo = sorted(positions.values())
+    inserted = {}
+
+    with engine.begin() as c:
+        # serializes concurrent writers of the same account until commit
+        for account_id in sorted({key[0] for key in positions}):
+            c.execute(text("SELECT pg_advisory_xact_lock(hashtext(:aid))"), {"aid": account_id})
+
+        for start in range(0, len(todo), INSERT_BATCH_SIZE):
+            values = []
+            params = {}
+
+            for i in todo[start:start + INSERT_BATCH_SIZE]:
+                mail = mails[i]
+                values.append(
+                    f"(CAST(:id{i} AS uuid), CAST(:account_id{i} AS uuid), :message_id{i}, :from_addr{i}, "
+                    f":to_addr{i}, :subject{i}, :category{i}, :confidence{i}, :reason{i}, "
+                    f"CAST(:expires_at{i} AS timestamp))"
+                )
+                params.update({
+                    f"id{i}": str(uuid.uuid4()),
+                    f"account_id{i}": mail["account_id"],
+                    f"message_id{i}": mail["message_id"],
+                    f"from_addr{i}": mail["from_addr"],
+                    f"to_addr{i}": mail["to_addr"],
+                    f"subject{i}": mail["subject"],
+                    f"category{i}": mail["category"],
+                    f"confidence{i}": mail["confidence"],
+                    f"reason{i}": mail["reason"],
+                    f"expires_at{i}": mail["expires_at"],
+                })
+
+            res = c.execute(text(f"""
+                INSERT INTO emails
+                (id, account_id, message_id, from_addr, to_addr, subject,
+                 category, confidence, reason, received_at, expires_at)
+                SELECT v.id, v.account_id, v.message_id, v.from_addr, v.to_addr, v.subject,
+                       v.category, v.confidence, v.reason, now(), v.expires_at
+                FROM (VALUES {", ".join(values)})
+                     AS v(id, account_id, message_id, from_addr, to_addr, subject,
+                          category, confidence, reason, expires_at)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM emails e
+                    WHERE e.account_id = v.account_id AND e.message_id = v.message_id
+                )
+                ON CONFLICT DO NOTHING
+                RETURNING id, account_id, message_id, from_addr, to_addr, subject,
+                          category, confidence, reason, received_at
+            """), params)
+
+            for row in res:
+                statuses[positions[(str(row.account_id), row.message_id)]] = True
+                inserted.setdefault(str(row.account_id), []).append({
+                    "id": str(row.id),
+                    "from": row.from_addr,
+                    "to": row.to_addr,
+                    "subject": row.subject,
+                    "category": row.category,
+                    "confidence": row.confidence,
+                    "reason": row.reason,
+                    "received_at": row.received_at.isoformat(),
+                })
+
+        # delivered only if the transaction commits
+        _notify_inserted(c, inserted)
+
+    _bump_cache_generation(inserted)
+    return statuses
+
+
+def _bump_cache_generation(account_ids):
+    global _redis
+    if not CACHE_REDIS_URL or not account_ids:
+        return
+
+    try:
+        if _redis is None:
+            import redis
+            _redis = redis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=2)
+        pipe = _redis.pipeline(transaction=False)
+        for account_id in account_ids:
+            pipe.incr(f"mailreader:gen:{account_id}")
+        pipe.execute()
+    except Exception as e:
+        # entries of those accounts stay served until RESPONSE_CACHE_TTL
+        logging.warning(f"CACHE GENERATION BUMP FAILED: {e}")
+
+
+def _notify_inserted(c, inserted: dict):
+    """
+    pg_notify(NOTIFY_CHANNEL, {"account_id", "inserted", "emails": [...]}) per account.
+    The API uses it for cache invalidation and the /emails/stream SSE feed.
+    Payloads are capped at 8000 bytes by Postgres, so long lists are split
+    and overlong text fields are trimmed.
+    """
+    for account_id, items in inserted.items():
+        chunk = []
+        size = 0
+
+        for item in items:
+            for field in ("from", "to", "subject", "reason"):
+                item[field] = (item[field] or "")[:NOTIFY_TEXT_MAX]
+            item_size = len(json.dumps(item).encode("utf-8"))
+
+            if chunk and size + item_size > NOTIFY_MAX_BYTES:
+                _notify(c, account_id, chunk)
+                chunk, size = [], 0
+
+            chunk.append(item)
+            size += item_size + 1
+
+        if chunk:
+            _notify(c, account_id, chunk)
+
+
+def _notify(c, account_id: str, items: list):
+    payload = {"account_id": account_id, "inserted": len(items), "emails": items}
+    c.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": NOTIFY_CHANNEL, "payload": json.dumps(payload)},
+    )
+
+
+def existing_message_ids(account_id, message_ids: list) -> set:
+    """
+    One round trip: which of these message_ids are already stored for the account.
+    """
+    if not message_ids:
+        return set()
+
+    with engine.connect() as c:
+        rows = c.execute(text("""
+            SELECT message_id
+            FROM emails
+            WHERE account_id = :aid AND message_id = ANY(:ids)
+        """), {"aid": account_id, "ids": list(message_ids)}).scalars().all()
+        return set(rows)
+
+
 def insert_email(mail: dict) -> bool:
     """
     Duplicate-safe insert (account_id + message_id).
     Returns True if inserted, False if skipped.
     """
-    if not mail.get("message_id"):
-        return False
+    return insert_emails([mail])[0]
+
 
-    mail_id = str(uuid.uuid4())
+def get_sync_state(account_id) -> dict:
+    """
+    Returns dict (empty if the account was never synced):
+      {imap_uidvalidity, imap_last_uid, graph_delta_link}
+    """
+    with engine.connect() as c:
+        row = c.execute(text("""
+            SELECT imap_uidvalidity, imap_last_uid, graph_delta_link
+            FROM sync_state
+            WHERE account_id = :aid
+        """), {"aid": account_id}).mappings().first()
+        return dict(row) if row else {}
 
+
+def save_imap_sync_state(account_id, uidvalidity: int, last_uid: int):
     with engine.begin() as c:
-        res = c.execute(text("""
-            INSERT INTO emails
-            (id, account_id, message_id, from_addr, to_addr, subject,
-             category, confidence, reason, received_at, expires_at)
-            SELECT
-            :id, :account_id, :message_id, :from_addr, :to_addr, :subject,
-            :category, :confidence, :reason, now(), :expires_at
-            WHERE NOT EXISTS (
-                SELECT 1 FROM emails
-                WHERE account_id = :account_id AND message_id = :message_id
-            )
-        """), {
-            "id": mail_id,
-            "account_id": mail["account_id"],
-            "message_id": mail["message_id"],
-            "from_addr": mail["from_addr"],
-            "to_addr": mail["to_addr"],
-            "subject": mail["subject"],
-            "category": mail["category"],
-            "confidence": mail["confidence"],
-            "reason": mail["reason"],
-            "expires_at": mail["expires_at"],
-        })
-
-        return (res.rowcount or 0) > 0
+        c.execute(text("""
+            INSERT INTO sync_state (account_id, imap_uidvalidity, imap_last_uid, updated_at)
+            VALUES (:aid, :v, :u, now())
+            ON CONFLICT (account_id) DO UPDATE
+            SET imap_uidvalidity = EXCLUDED.imap_uidvalidity,
+                imap_last_uid = EXCLUDED.imap_last_uid,
+                updated_at = now()
+        """), {"aid": account_id, "v": uidvalidity, "u": last_uid})
+
+
+def save_graph_delta_link(account_id, delta_link: str):
+    with engine.begin() as c:
+        c.execute(text("""
+            INSERT INTO sync_state (account_id, graph_delta_link, updated_at)
+            VALUES (:aid, :d, now())
+            ON CONFLICT (account_id) DO UPDATE
+            SET graph_delta_link = EXCLUDED.graph_delta_link,
+                updated_at = now()
+        """), {"aid": account_id, "d": delta_link})
+
+
+def get_cached_classification(content_hash: str) -> dict | None:
+    """
+    Returns {category, confidence, reason, ttl} or None (missing / expired).
+    """
+    with engine.connect() as c:
+        row = c.execute(text("""
+            SELECT category, confidence, reason,
+                   EXTRACT(EPOCH FROM (expires_at - now())) AS ttl
+            FROM classification_cache
+            WHERE content_hash = :h AND expires_at > now()
+        """), {"h": content_hash}).mappings().first()
+        return dict(row) if row else None
+
+
+def put_cached_classification(content_hash: str, category: str, confidence: int, reason: str, ttl: int):
+    with engine.begin() as c:
+        c.execute(text("""
+            INSERT INTO classification_cache (content_hash, category, confidence, reason, expires_at)
+            VALUES (:h, :c, :conf, :r, now() + make_interval(secs => :ttl))
+            ON CONFLICT (content_hash) DO UPDATE
+            SET category = EXCLUDED.category,
+                confidence = EXCLUDED.confidence,
+                reason = EXCLUDED.reason,
+                expires_at = EXCLUDED.expires_at
+        """), {"h": content_hash, "c": category, "conf": confidence, "r": reason[:255], "ttl": ttl})
@@ -1,6 +1,18 @@
+import os
+import time
+import threading
 import requests
+from datetime import datetime
 
 GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+GRAPH_SELECT = "id,subject,from,toRecipients,bodyPreview,internetMessageId"
+GRAPH_PAGE_SIZE = int(os.getenv("GRAPH_PAGE_SIZE", "50"))
+TOKEN_EXPIRY_MARGIN = int(os.getenv("TOKEN_EXPIRY_MARGIN", "300"))
+
+# account_id -> {access_token, expires_at, refresh_tokens}
+_TOKENS = {}
+_TOKEN_LOCKS = {}
+_TOKEN_LOCKS_GUARD = threading.Lock()
 
 
 def refresh_access_token(tenant_id: str, client_id: str, client_secret: str, refresh_token: str) -> dict:
@@ -20,39 +32,138 @@ def refresh_access_token(tenant_id: str, client_id: str, client_secret: str, ref
     return r.json()
 
 
+def get_access_token(account_id, tenant_id: str, client_id: str, client_secret: str, refresh_token: str):
+    """
+    In-process access token cache.
+    Returns (access_token, rotated_refresh_token or None).
+
+    Tokens are reused until `expires_in` minus TOKEN_EXPIRY_MARGIN; callers
+    racing on one account share a single refresh. A rotated refresh token is
+    returned only to the caller that performed the refresh, so it is
+    persisted once.
+    """
+    with _TOKEN_LOCKS_GUARD:
+        lock = _TOKEN_LOCKS.setdefault(account_id, threading.Lock())
+
+    with lock:
+        entry = _TOKENS.get(account_id)
+        if (
+            entry
+            and refresh_token in entry["refresh_tokens"]
+            and time.time() < entry["expires_at"]
+        ):
+            return entry["access_token"], None
+
+        token_json = refresh_access_token(tenant_id, client_id, client_secret, refresh_token)
+        access_token = token_json.get("access_token", "")
+        expires_in = int(token_json.get("expires_in") or 3600)
+
+        new_refresh = token_json.get("refresh_token")
+        if new_refresh == refresh_token:
+            new_refresh = None
+
+        _TOKENS[account_id] = {
+            "access_token": access_token,
+            "expires_at": time.time() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0),
+            # the stored secret may still hold the pre-rotation token
+            "refresh_tokens": {refresh_token, new_refresh or refresh_token},
+        }
+        return access_token, new_refresh
+
+
+def invalidate_access_token(account_id):
+    """
+    Drops a cached token (e.g. after Graph answered 401).
+    """
+    _TOKENS.pop(account_id, None)
+
+
+def _normalize_message(m: dict) -> dict:
+    from_addr = ""
+    try:
+        from_addr = m.get("from", {}).get("emailAddress", {}).get("address", "") or ""
+    except Exception:
+        from_addr = ""
+
+    to_addr = ""
+    try:
+        rec = (m.get("toRecipients") or [])
+        if rec:
+            to_addr = rec[0].get("emailAddress", {}).get("address", "") or ""
+    except Exception:
+        to_addr = ""
+
+    return {
+        "message_id": (m.get("internetMessageId") or m.get("id") or ""),
+        "subject": (m.get("subject") or ""),
+        "from": from_addr,
+        "to": to_addr,
+        "body": (m.get("bodyPreview") or "")
+    }
+
+
 def fetch_graph_mails(access_token: str, limit: int = 10):
     """
     Normalizes into:
       message_id, subject, from, to, body
     """
     headers = {"Authorization": f"Bearer {access_token}"}
-    url = f"{GRAPH_BASE}/me/mailFolders/Inbox/messages?$top={limit}&$select=id,subject,from,toRecipients,bodyPreview,internetMessageId"
+    url = f"{GRAPH_BASE}/me/mailFolders/Inbox/messages?$top={limit}&$select={GRAPH_SELECT}"
     r = requests.get(url, headers=headers, timeout=30)
     r.raise_for_status()
     items = r.json().get("value", []) or []
 
+    return [_normalize_message(m) for m in items]
+
+
+def fetch_graph_delta(access_token: str, delta_link: str | None = None, since: datetime | None = None):
+    """
+    Inbox delta sync.
+    Returns (mails, delta_link) -> persist delta_link only after mails are stored.
+
+    Without a delta_link the initial round enumerates the Inbox (from `since`
+    if given); later rounds return only changes. Every @odata.nextLink page
+    is followed until Graph hands out the next @odata.deltaLink.
+    An expired delta token (410 Gone) restarts the initial round.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Prefer": f"odata.maxpagesize={GRAPH_PAGE_SIZE}",
+    }
+
+    def _initial():
+        params = {"$select": GRAPH_SELECT}
+        if since:
+            params["$filter"] = f"receivedDateTime ge {since.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+        return f"{GRAPH_BASE}/me/mailFolders/Inbox/messages/delta", params
+
+    url, params = (delta_link, None) if delta_link else _initial()
     out = []
-    for m in items:
-        from_addr = ""
-        try:
-            from_addr = m.get("from", {}).get("emailAddress", {}).get("address", "") or ""
-        except Exception:
-            from_addr = ""
 
-        to_addr = ""
-        try:
-            rec = (m.get("toRecipients") or [])
-            if rec:
-                to_addr = rec[0].get("emailAddress", {}).get("address", "") or ""
-        except Exception:
-            to_addr = ""
-
-        out.append({
-            "message_id": (m.get("internetMessageId") or m.get("id") or ""),
-            "subject": (m.get("subject") or ""),
-            "from": from_addr,
-            "to": to_addr,
-            "body": (m.get("bodyPreview") or "")
-        })
-
-    return out
+    with requests.Session() as sess:
+        while True:
+            r = sess.get(url, headers=headers, params=params, timeout=30)
+
+            if r.status_code == 410 and delta_link:
+                # sync state expired on the server: start over
+                delta_link = None
+                out = []
+                url, params = _initial()
+                continue
+
+            r.raise_for_status()
+            data = r.json()
+
+            for m in data.get("value", []) or []:
+                # deletions / moves out of the Inbox
+                if "@removed" in m:
+                    continue
+                out.append(_normalize_message(m))
+
+            next_link = data.get("@odata.nextLink")
+            if next_link:
+                # next/delta links already carry every query option
+                url, params = next_link, None
+                continue
+
+            return out, data.get("@odata.deltaLink") or delta_link
@@ -1,42 +1,99 @@
+import os
 from imapclient import IMAPClient
 
+IMAP_TIMEOUT = int(os.getenv("IMAP_TIMEOUT", "60"))
+IMAP_FETCH_BATCH = int(os.getenv("IMAP_FETCH_BATCH", "200"))
 
-def fetch_imap_mails(host, username, password, port=993, limit=10):
+
+def _envelope_to_mail(env) -> dict:
+    msg_id = env.message_id.decode() if env.message_id else ""
+    subject = env.subject.decode(errors="ignore") if env.subject else ""
+
+    from_addr = ""
+    if env.from_ and len(env.from_) > 0:
+        mb = env.from_[0].mailbox.decode(errors="ignore") if env.from_[0].mailbox else ""
+        hs = env.from_[0].host.decode(errors="ignore") if env.from_[0].host else ""
+        if mb and hs:
+            from_addr = f"{mb}@{hs}"
+
+    return {
+        "message_id": msg_id,
+        "subject": subject,
+        "from": from_addr,
+        "body": ""
+    }
+
+
+def connect(host, username, password, port=993) -> IMAPClient:
+    """
+    Opens an authenticated TLS session (caller owns logout).
+    """
+    server = IMAPClient(host, port=port, ssl=True, timeout=IMAP_TIMEOUT)
+    try:
+        server.login(username, password)
+    except Exception:
+        try:
+            server.shutdown()
+        except Exception:
+            pass
+        raise
+    return server
+
+
+def sync_inbox(server: IMAPClient, limit=10, uidvalidity=None, last_uid=0):
     """
-    Normalizes into:
-      message_id, subject, from, body(empty)
+    Incremental INBOX sync against a UID watermark on an open session.
+    Returns (mails, sync):
+      mails: message_id, subject, from, body(empty)
+      sync:  {uidvalidity, last_uid} -> persist only after mails are stored
+
+    First sync (or UIDVALIDITY reset) takes the newest `limit` mails and
+    moves the watermark to the top of the mailbox; after that only
+    `UID last_uid+1:*` is fetched, in IMAP_FETCH_BATCH chunks.
     """
+    last_uid = int(last_uid or 0)
     mails = []
 
-    with IMAPClient(host, port=port, ssl=True) as server:
-        server.login(username, password)
-        server.select_folder("INBOX")
+    info = server.select_folder("INBOX", readonly=True)
 
+    cur_validity = int(info.get(b"UIDVALIDITY") or 0)
+    uidnext = int(info.get(b"UIDNEXT") or 0)
+
+    if not last_uid or uidvalidity is None or int(uidvalidity) != cur_validity:
+        # baseline: UIDs of the old validity epoch mean nothing any more
         ids = server.search(["NOT", "DELETED"])
-        ids = ids[-limit:] if ids else []
+        uids = ids[-limit:] if ids else []
+        top = max(ids) if ids else 0
+    else:
+        if uidnext and uidnext <= last_uid + 1:
+            return [], {"uidvalidity": cur_validity, "last_uid": last_uid}
+
+        # "n:*" always matches the highest UID, even when it is < n
+        uids = [
+            u for u in server.search(["UID", f"{last_uid + 1}:*", "NOT", "DELETED"])
+            if u > last_uid
+        ]
+        top = max(uids) if uids else last_uid
 
-        if not ids:
-            return []
+    # mails that arrive after SELECT get UID >= UIDNEXT, so UIDNEXT-1 is safe
+    new_last = max(top, uidnext - 1)
 
-        fetched = server.fetch(ids, ["ENVELOPE"])
-        for _, msg in fetched.items():
-            env = msg[b"ENVELOPE"]
+    for i in range(0, len(uids), IMAP_FETCH_BATCH):
+        batch = uids[i:i + IMAP_FETCH_BATCH]
+        fetched = server.fetch(batch, ["ENVELOPE"])
 
-            msg_id = env.message_id.decode() if env.message_id else ""
-            subject = env.subject.decode(errors="ignore") if env.subject else ""
+        for uid in batch:
+            msg = fetched.get(uid)
+            if not msg or b"ENVELOPE" not in msg:
+                continue
+            mails.append(_envelope_to_mail(msg[b"ENVELOPE"]))
 
-            from_addr = ""
-            if env.from_ and len(env.from_) > 0:
-                mb = env.from_[0].mailbox.decode(errors="ignore") if env.from_[0].mailbox else ""
-                hs = env.from_[0].host.decode(errors="ignore") if env.from_[0].host else ""
-                if mb and hs:
-                    from_addr = f"{mb}@{hs}"
+    return mails, {"uidvalidity": cur_validity, "last_uid": new_last}
 
-            mails.append({
-                "message_id": msg_id,
-                "subject": subject,
-                "from": from_addr,
-                "body": ""
-            })
 
-    return mails
+def fetch_imap_mails(host, username, password, port=993, limit=10, uidvalidity=None, last_uid=0):
+    """
+    One-shot connection variant of sync_inbox (same return value).
+    """
+    with connect(host, username, password, port=port) as server:
+        return sync_inbox(server, limit=limit, uidvalidity=uidvalidity, last_uid=last_uid)
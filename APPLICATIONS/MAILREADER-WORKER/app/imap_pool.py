@@ -0,0 +1,323 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from app.imap_client import connect
+from app.scheduler import PER_HOST_CONCURRENCY
+
+# ========================== CONFIG ==========================
+IMAP_MAX_CONN_PER_HOST = int(os.getenv("IMAP_MAX_CONN_PER_HOST", "20"))
+# IDLE watchers hold their socket; leave room for the concurrent fetches
+IMAP_MAX_WATCH_PER_HOST = int(os.getenv(
+    "IMAP_MAX_WATCH_PER_HOST", str(max(IMAP_MAX_CONN_PER_HOST - PER_HOST_CONCURRENCY, 0))
+))
+IMAP_CONNECT_WAIT = int(os.getenv("IMAP_CONNECT_WAIT", "30"))
+IMAP_NOOP_INTERVAL = int(os.getenv("IMAP_NOOP_INTERVAL", "240"))
+IMAP_IDLE_CHECK = int(os.getenv("IMAP_IDLE_CHECK", "5"))
+IMAP_IDLE_RENEW = int(os.getenv("IMAP_IDLE_RENEW", "1500"))  # RFC 2177: < 29 min
+IMAP_BACKOFF_MAX = int(os.getenv("IMAP_BACKOFF_MAX", "300"))
+
+
+class _Session:
+    """
+    One authenticated connection per account.
+    `lock` serializes users (fetch vs IDLE watcher); a fetcher sets `wanted`
+    before waiting on the lock so the watcher leaves IDLE and hands it over.
+    """
+
+    def __init__(self, key, host, port, username, password):
+        self.key = key
+        self.host = host.lower()
+        self.creds = (self.host, port, username, password)
+        self.client = None
+        self.lock = threading.Lock()
+        self.wanted = threading.Event()
+        self.last_used = 0.0
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+class ImapPool:
+    """
+    Long-lived IMAP sessions keyed by account, with a per-host socket cap,
+    NOOP keepalive, reconnect with exponential backoff and optional IDLE
+    watchers that report new mail through a callback.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._sessions = {}
+        self._host_slots = {}
+        self._watchers = {}
+        self._no_idle = set()
+
+    # -------- internals --------
+    def _get(self, key, host, port, username, password) -> _Session:
+        with self._guard:
+            sess = self._sessions.get(key)
+            if sess is None:
+                sess = _Session(key, host, port, username, password)
+                self._sessions[key] = sess
+            return sess
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._guard:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(IMAP_MAX_CONN_PER_HOST)
+                self._host_slots[host] = slot
+            return slot
+
+    def _evict_idle(self, host: str) -> bool:
+        """
+        Frees one socket on `host` held by the least recently used session
+        that is not busy. Unwatched sessions go first; if every socket is
+        held by an IDLE watcher, the least recently used watcher is stopped.
+        """
+        with self._guard:
+            candidates = sorted(
+                (s for s in self._sessions.values() if s.host == host and s.client is not None),
+                key=lambda s: (s.key in self._watchers, s.last_used),
+            )
+
+        for sess in candidates:
+            if sess.key in self._watchers:
+                if self._stop_watcher(sess):
+                    return True
+                continue
+            if sess.lock.acquire(blocking=False):
+                try:
+                    self._disconnect(sess)
+                    return True
+                finally:
+                    sess.lock.release()
+        return False
+
+    def _stop_watcher(self, sess: _Session) -> bool:
+        with self._guard:
+            watcher = self._watchers.pop(sess.key, None)
+        if watcher is None:
+            return False
+
+        logging.warning(f"IMAP IDLE WATCHER {sess.key} STOPPED: {sess.host} CONNECTION CAP REACHED")
+        watcher[1].set()
+        # the watcher leaves IDLE within IMAP_IDLE_CHECK and releases the lock
+        if not sess.lock.acquire(timeout=IMAP_IDLE_CHECK + 5):
+            return False
+        try:
+            self._disconnect(sess)
+            return True
+        finally:
+            sess.lock.release()
+
+    def _backoff(self, sess: _Session):
+        sess.failures += 1
+        sess.retry_at = time.monotonic() + min(IMAP_BACKOFF_MAX, 2 ** sess.failures)
+
+    def _connect(self, sess: _Session):
+        if time.monotonic() < sess.retry_at:
+            raise ConnectionError(f"IMAP backoff for {sess.key} ({sess.host})")
+
+        slot = self._slot(sess.host)
+        if not slot.acquire(blocking=False):
+            self._evict_idle(sess.host)
+            if not slot.acquire(timeout=IMAP_CONNECT_WAIT):
+                raise ConnectionError(f"IMAP connection cap reached for {sess.host}")
+
+        _, port, username, password = sess.creds
+        try:
+            sess.client = connect(sess.host, username, password, port=port)
+        except Exception:
+            slot.release()
+            self._backoff(sess)
+            raise
+
+        sess.failures = 0
+        sess.last_used = time.monotonic()
+
+    def _disconnect(self, sess: _Session):
+        if sess.client is None:
+            return
+        try:
+            sess.client.logout()
+        except Exception:
+            pass
+        sess.client = None
+        self._slot(sess.host).release()
+
+    def _checkout(self, sess: _Session, creds: tuple | None = None):
+        """
+        Called with sess.lock held. Returns a live client.
+        """
+        if creds and creds != sess.creds:
+            # releases the slot of the old host before moving to the new one
+            self._disconnect(sess)
+            sess.host, sess.creds = creds[0], creds
+            with self._guard:
+                watcher = self._watchers.pop(sess.key, None)
+            if watcher:
+                # counted under the old host; the next watch() re-registers it
+                watcher[1].set()
+
+        if sess.client is not None and time.monotonic() - sess.last_used > IMAP_NOOP_INTERVAL:
+            try:
+                sess.client.noop()
+            except Exception:
+                self._disconnect(sess)
+
+        if sess.client is None:
+            self._connect(sess)
+
+        return sess.client
+
+    # -------- public --------
+    @contextmanager
+    def session(self, key, host, port, username, password):
+        """
+        Yields an authenticated client for the account. Any error raised
+        while using it drops the connection; the next use reconnects.
+        """
+        sess = self._get(key, host, port, username, password)
+
+        sess.wanted.set()
+        with sess.lock:
+            sess.wanted.clear()
+            client = self._checkout(sess, (host.lower(), port, username, password))
+            try:
+                yield client
+            except Exception:
+                self._disconnect(sess)
+                raise
+            finally:
+                sess.last_used = time.monotonic()
+
+    def keepalive(self):
+        """
+        NOOPs sessions that sat unused for IMAP_NOOP_INTERVAL (skips busy ones).
+        """
+        with self._guard:
+            sessions = list(self._sessions.values())
+
+        now = time.monotonic()
+        for sess in sessions:
+            if sess.client is None or now - sess.last_used < IMAP_NOOP_INTERVAL:
+                continue
+            if not sess.lock.acquire(blocking=False):
+                continue
+            try:
+                sess.client.noop()
+                sess.last_used = now
+            except Exception as e:
+                logging.warning(f"IMAP KEEPALIVE FAILED {sess.key}: {e}")
+                self._disconnect(sess)
+            finally:
+                sess.lock.release()
+
+    def prune(self, active_keys: set):
+        """
+        Stops watchers and closes sessions of accounts that no longer exist.
+        """
+        with self._guard:
+            stale = [k for k in self._sessions if k not in active_keys]
+
+        for key in stale:
+            with self._guard:
+                watcher = self._watchers.pop(key, None)
+                sess = self._sessions.pop(key, None)
+            if watcher:
+                watcher[1].set()
+            if sess:
+                with sess.lock:
+                    self._disconnect(sess)
+
+    def close_all(self):
+        self.prune(set())
+
+    # -------- IDLE --------
+    def watch(self, key, host, port, username, password, on_new_mail):
+        """
+        Starts (once) a background IDLE watcher for the account, at most
+        IMAP_MAX_WATCH_PER_HOST per host.
+        on_new_mail(key) is called whenever the server reports EXISTS.
+        """
+        with self._guard:
+            if key in self._no_idle:
+                return
+            watcher = self._watchers.get(key)
+            if watcher and watcher[0].is_alive():
+                return
+            # beyond the cap the account is simply polled every cycle
+            if sum(1 for w in self._watchers.values() if w[2] == host.lower()) >= IMAP_MAX_WATCH_PER_HOST:
+                return
+
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=self._idle_loop,
+                args=(key, host, port, username, password, on_new_mail, stop),
+                name=f"imap-idle-{key}",
+                daemon=True,
+            )
+            self._watchers[key] = (thread, stop, host.lower())
+
+        thread.start()
+
+    def _idle_loop(self, key, host, port, username, password, on_new_mail, stop):
+        sess = self._get(key, host, port, username, password)
+
+        while not stop.is_set():
+            # a fetch is waiting for the connection: let it go first
+            if sess.wanted.is_set():
+                stop.wait(0.2)
+                continue
+
+            new_mail = False
+            try:
+                with sess.lock:
+                    client = self._checkout(sess)
+                    try:
+                        if b"IDLE" not in client.capabilities():
+                            logging.info(f"IMAP IDLE NOT SUPPORTED by {sess.host}, polling only")
+                            with self._guard:
+                                self._no_idle.add(key)
+                            stop.set()
+                            break
+
+                        client.select_folder("INBOX", readonly=True)
+                        client.idle()
+                        try:
+                            started = time.monotonic()
+                            while (
+                                not stop.is_set()
+                                and not sess.wanted.is_set()
+                                and time.monotonic() - started < IMAP_IDLE_RENEW
+                            ):
+                                responses = client.idle_check(timeout=IMAP_IDLE_CHECK)
+                                if any(len(r) > 1 and r[1] == b"EXISTS" for r in responses):
+                                    new_mail = True
+                                    break
+                        finally:
+                            client.idle_done()
+                    except Exception:
+                        self._disconnect(sess)
+                        raise
+                    finally:
+                        sess.last_used = time.monotonic()
+
+            except Exception as e:
+                logging.warning(f"IMAP IDLE ERROR {key}: {e}")
+                if sess.retry_at <= time.monotonic():
+                    self._backoff(sess)
+                stop.wait(max(sess.retry_at - time.monotonic(), 1))
+                continue
+
+            if new_mail:
+                try:
+                    on_new_mail(key)
+                except Exception as e:
+                    logging.error(f"IMAP IDLE CALLBACK ERROR {key}: {e}")
+
+        with self._guard:
+            if self._watchers.get(key, (None,))[0] is threading.current_thread():
+                self._watchers.pop(key, None)
@@ -1,12 +1,33 @@
 import os
 import re
 import json
+import time
+import threading
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from app import classification_cache
 
 # =========================================================
 # CONFIG
 # =========================================================
 LLM_URL = (os.getenv("LLM_BASE_URL") or "").rstrip("/")
+LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", "90"))
+
+# keep in line with llama.cpp --parallel: one in-flight request per slot
+LLM_PARALLEL = int(os.getenv("LLM_PARALLEL", "4"))
+
+_HTTP = requests.Session()
+_HTTP.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=LLM_PARALLEL))
+_HTTP.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=LLM_PARALLEL))
+
+# shared by every account thread -> global classification queue
+_QUEUE = ThreadPoolExecutor(max_workers=LLM_PARALLEL, thread_name_prefix="llm")
+
+# content_hash -> Future: identical mails queued at the same time share one call
+_IN_FLIGHT = {}
+_IN_FLIGHT_LOCK = threading.Lock()
 
 # =========================================================
 # HELPERS
@@ -98,11 +119,28 @@ def classify(mail: dict) -> tuple[str, int, str]:
     """
     Returns (category, confidence, reason)
     Safe fallback if LLM fails
+    Identical subject/sender/body is answered from classification_cache.
     """
 
     if not LLM_URL:
         return "normal", 50, "llm_disabled"
 
+    key = classification_cache.content_key(mail)
+    cached = classification_cache.get(key)
+    if cached:
+        return cached
+
+    started = time.monotonic()
+    result = _classify_llm(mail)
+
+    # failures are not cached: the next copy gets a fresh try
+    if result[2] != "llm_error":
+        classification_cache.put(key, result, time.monotonic() - started)
+
+    return result
+
+
+def _classify_llm(mail: dict) -> tuple[str, int, str]:
     body = mail.get("body", "") or ""
     signals = extract_suspicious_signals(body)
 
@@ -116,13 +154,15 @@ def classify(mail: dict) -> tuple[str, int, str]:
         ),
         "temperature": 0.0,
         "n_predict": 256,
+        # PROMPT prefix is identical for every mail: reuse the slot's KV cache
+        "cache_prompt": True,
     }
 
     try:
-        r = requests.post(
+        r = _HTTP.post(
             f"{LLM_URL}/completion",
             json=payload,
-            timeout=90,
+            timeout=LLM_TIMEOUT,
         )
         r.raise_for_status()
 
@@ -146,6 +186,29 @@ def classify(mail: dict) -> tuple[str, int, str]:
         return "normal", 50, "llm_error"
 
 
+def submit_classification(mail: dict) -> Future:
+    """
+    Queues classify(mail); at most LLM_PARALLEL requests hit the server at once.
+    Future result: (category, confidence, reason)
+    """
+    key = classification_cache.content_key(mail)
+
+    with _IN_FLIGHT_LOCK:
+        fut = _IN_FLIGHT.get(key)
+        if fut is not None:
+            return fut
+        fut = _QUEUE.submit(classify, mail)
+        _IN_FLIGHT[key] = fut
+
+    def _done(_):
+        with _IN_FLIGHT_LOCK:
+            if _IN_FLIGHT.get(key) is fut:
+                del _IN_FLIGHT[key]
+
+    fut.add_done_callback(_done)
+    return fut
+
+
 # =========================================================
 # OPTIONAL ENRICHMENT (future use)
 # =========================================================
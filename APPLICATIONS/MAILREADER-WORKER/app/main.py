@@ -1,20 +1,44 @@
 import os
 import time
 import logging
+import threading
+import requests
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import as_completed
 
-from app.db import get_accounts, get_rules, insert_email, update_secret_payload
-from app.rule_engine import apply_rules
-from app.llm_classifier import classify
-from app.security import decrypt_payload, encrypt_payload
+from app.db import (
+    get_snapshot,
+    insert_emails,
+    existing_message_ids,
+    update_secret_payload,
+    get_sync_state,
+    save_imap_sync_state,
+    save_graph_delta_link,
+)
+from app.rule_engine import apply_rules, get_compiled_rules, forget_compiled_rules
+from app.llm_classifier import submit_classification
+from app import classification_cache
+from app.security import decrypt_payload, encrypt_payload, forget_payloads
 
-from app.graph_client import refresh_access_token, fetch_graph_mails
-from app.imap_client import fetch_imap_mails
+from app.graph_client import (
+    get_access_token,
+    invalidate_access_token,
+    fetch_graph_mails,
+    fetch_graph_delta,
+)
+from app.imap_client import fetch_imap_mails, sync_inbox
+from app.imap_pool import ImapPool
+from app.scheduler import run_accounts, host_slot
 
 # ========================== CONFIG ==========================
 FETCH_INTERVAL = int(os.getenv("FETCH_INTERVAL", "10"))
 FETCH_LIMIT = int(os.getenv("FETCH_LIMIT", "10"))
 RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "3"))
+GRAPH_SYNC_MODE = os.getenv("GRAPH_SYNC_MODE", "delta").strip().lower()  # delta | poll
+IMAP_POOL = os.getenv("IMAP_POOL", "true").strip().lower() in ("1", "true", "yes")
+IMAP_IDLE = os.getenv("IMAP_IDLE", "true").strip().lower() in ("1", "true", "yes")
+SEEN_CACHE_SIZE = int(os.getenv("SEEN_CACHE_SIZE", "2000"))  # message_ids per account
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,14 +49,102 @@ logging.basicConfig(
 def INTRO():
     logging.info("EIGHT - SKYLIGHT MAILREADER WORKER (SERVICE MODE)")
 
+# ========================== IMAP PUSH ==========================
+_IMAP_POOL = ImapPool()
+
+# accounts reported by IDLE watchers, drained by service_loop
+_WAKE = threading.Event()
+_WOKEN = set()
+_WOKEN_LOCK = threading.Lock()
+
+
+def _on_new_mail(account_id):
+    with _WOKEN_LOCK:
+        _WOKEN.add(account_id)
+    _WAKE.set()
+
+
+def _take_woken() -> set:
+    with _WOKEN_LOCK:
+        woken = set(_WOKEN)
+        _WOKEN.clear()
+    return woken
+
+# ========================== DEDUP ==========================
+# account_id -> OrderedDict(message_id -> None), most recent last
+_SEEN = {}
+_SEEN_LOCK = threading.Lock()
+
+
+def _remember_seen(account_id, message_ids):
+    with _SEEN_LOCK:
+        seen = _SEEN.setdefault(account_id, OrderedDict())
+        for mid in message_ids:
+            seen[mid] = None
+            seen.move_to_end(mid)
+        while len(seen) > SEEN_CACHE_SIZE:
+            seen.popitem(last=False)
+
+
+def _only_new(acc: dict, mails: list) -> list:
+    """
+    Drops mails already stored (or repeated in the batch) before any rule or
+    LLM work: in-memory recent set first, one batched query for the rest.
+    """
+    new = []
+    ids = set()
+    for m in mails:
+        mid = m.get("message_id") or ""
+        if not mid or mid in ids:
+            continue
+        ids.add(mid)
+        new.append(m)
+
+    with _SEEN_LOCK:
+        seen = _SEEN.get(acc["id"]) or {}
+        known = {mid for mid in ids if mid in seen}
+
+    unknown = ids - known
+    if unknown:
+        stored = existing_message_ids(acc["id"], list(unknown))
+        _remember_seen(acc["id"], stored)
+        known |= stored
+
+    return [m for m in new if m["message_id"] not in known]
+
+
 # ========================== CORE ==========================
+def _save_sync(acc: dict, imap_sync: dict | None, delta_link: str | None):
+    if imap_sync:
+        save_imap_sync_state(acc["id"], imap_sync["uidvalidity"], imap_sync["last_uid"])
+    if delta_link:
+        save_graph_delta_link(acc["id"], delta_link)
+
+
+def _mail_row(acc: dict, m: dict, category: str, confidence: int, reason: str) -> dict:
+    return {
+        "account_id": acc["id"],
+        "message_id": m.get("message_id", "") or "",
+        "from_addr": m.get("from", "") or "",
+        "to_addr": m.get("to", "") or "",
+        "subject": m.get("subject", "") or "",
+        "category": category,
+        "confidence": int(confidence),
+        "reason": (reason or "")[:255],
+        "expires_at": datetime.utcnow() + timedelta(days=RETENTION_DAYS),
+    }
+
+
 def process_account(acc: dict):
-    rules = get_rules(acc["id"])
+    rules = get_compiled_rules(acc["id"], acc["rules"])
 
-    secrets = decrypt_payload(acc["enc_payload"])
+    # cached per ciphertext: no Fernet work unless the secret changed
+    secrets = decrypt_payload(acc["enc_payload"], acc["id"])
     auth_method = (acc.get("auth_method") or secrets.get("auth_method") or "imap").lower()
 
     mails = []
+    imap_sync = None
+    delta_link = None
 
     # -------- EXCHANGE --------
     if auth_method == "exchange":
@@ -45,18 +157,31 @@ def process_account(acc: dict):
             logging.warning(f"EXCHANGE CONFIG MISSING for {acc['email']}")
             return
 
-        token_json = refresh_access_token(
-            tenant_id, client_id, client_secret, refresh_token
-        )
-        access_token = token_json.get("access_token", "")
+        with host_slot(f"exchange:{tenant_id}"):
+            access_token, new_refresh = get_access_token(
+                acc["id"], tenant_id, client_id, client_secret, refresh_token
+            )
 
-        new_refresh = token_json.get("refresh_token")
-        if new_refresh and new_refresh != refresh_token:
-            secrets["refresh_token"] = new_refresh
-            update_secret_payload(acc["id"], encrypt_payload(secrets))
-            logging.info(f"REFRESH TOKEN UPDATED for {acc['email']}")
+            if new_refresh:
+                secrets["refresh_token"] = new_refresh
+                update_secret_payload(acc["id"], encrypt_payload(secrets))
+                logging.info(f"REFRESH TOKEN UPDATED for {acc['email']}")
 
-        mails = fetch_graph_mails(access_token, limit=FETCH_LIMIT)
+            try:
+                if GRAPH_SYNC_MODE == "delta":
+                    state = get_sync_state(acc["id"])
+                    mails, delta_link = fetch_graph_delta(
+                        access_token,
+                        delta_link=state.get("graph_delta_link"),
+                        since=datetime.utcnow() - timedelta(days=RETENTION_DAYS),
+                    )
+                else:
+                    mails = fetch_graph_mails(access_token, limit=FETCH_LIMIT)
+            except requests.HTTPError as e:
+                # revoked / invalidated token: force a refresh next cycle
+                if e.response is not None and e.response.status_code == 401:
+                    invalidate_access_token(acc["id"])
+                raise
 
         for m in mails:
             m.setdefault("to", acc["email"])
@@ -73,13 +198,30 @@ def process_account(acc: dict):
             logging.warning(f"IMAP CONFIG MISSING for {acc['email']}")
             return
 
-        mails = fetch_imap_mails(
-            host=host,
-            username=username,
-            password=password,
-            port=port,
-            limit=FETCH_LIMIT
-        )
+        state = get_sync_state(acc["id"])
+
+        with host_slot(f"imap:{host.lower()}"):
+            if IMAP_POOL:
+                with _IMAP_POOL.session(acc["id"], host, port, username, password) as server:
+                    mails, imap_sync = sync_inbox(
+                        server,
+                        limit=FETCH_LIMIT,
+                        uidvalidity=state.get("imap_uidvalidity"),
+                        last_uid=state.get("imap_last_uid") or 0,
+                    )
+            else:
+                mails, imap_sync = fetch_imap_mails(
+                    host=host,
+                    username=username,
+                    password=password,
+                    port=port,
+                    limit=FETCH_LIMIT,
+                    uidvalidity=state.get("imap_uidvalidity"),
+                    last_uid=state.get("imap_last_uid") or 0,
+                )
+
+        if IMAP_POOL and IMAP_IDLE:
+            _IMAP_POOL.watch(acc["id"], host, port, username, password, _on_new_mail)
 
         for m in mails:
             m["to"] = acc["email"]
@@ -91,59 +233,85 @@ def process_account(acc: dict):
 
     if not mails:
         logging.info(f"NO MAILS for {acc['email']}")
+        _save_sync(acc, imap_sync, delta_link)
+        return
+
+    fetched = len(mails)
+    mails = _only_new(acc, mails)
+    if not mails:
+        logging.info(f"NO NEW MAILS for {acc['email']} ({fetched} already stored)")
+        _save_sync(acc, imap_sync, delta_link)
         return
 
     # ================== MAIL PIPELINE ==================
+    rows = []
+    pending = {}
     for m in mails:
         # 1️⃣ RULE ENGINE (ÖNCE)
         action, rule_name = apply_rules(m, rules)
 
         if action:
             category = (action.get("set_category") or "normal").lower()
-            confidence = 90
-            reason = f"rule:{rule_name}"
-
+            rows.append(_mail_row(acc, m, category, 90, f"rule:{rule_name}"))
         else:
-            # 2️⃣ LLM CLASSIFIER (🔥 ASIL AKIL BURADA)
-            category, confidence, reason = classify(m)
+            # 2️⃣ LLM CLASSIFIER (🔥 ASIL AKIL BURADA) -> shared queue
+            # identical mails share one future
+            pending.setdefault(submit_classification(m), []).append(m)
 
+    for fut in as_completed(pending):
+        category, confidence, reason = fut.result()
+
+        for m in pending[fut]:
             logging.info(
                 f"LLM classified | {acc['email']} | {m.get('subject','')[:40]} → {category} ({confidence})"
             )
+            rows.append(_mail_row(acc, m, category, confidence, reason))
+
+    # one statement / one commit for the whole cycle
+    statuses = insert_emails(rows)
+    _remember_seen(acc["id"], [r["message_id"] for r in rows if r["message_id"]])
 
-        mail_row = {
-            "account_id": acc["id"],
-            "message_id": m.get("message_id", "") or "",
-            "from_addr": m.get("from", "") or "",
-            "to_addr": m.get("to", "") or "",
-            "subject": m.get("subject", "") or "",
-            "category": category,
-            "confidence": int(confidence),
-            "reason": (reason or "")[:255],
-            "expires_at": datetime.utcnow() + timedelta(days=RETENTION_DAYS),
-        }
-
-        inserted = insert_email(mail_row)
+    for mail_row, inserted in zip(rows, statuses):
         if inserted:
             logging.info(
-                f"INSERTED {category.upper()} - {acc['email']} - {mail_row['subject'][:60]}"
+                f"INSERTED {mail_row['category'].upper()} - {acc['email']} - {mail_row['subject'][:60]}"
             )
         else:
             logging.info(
                 f"SKIPPED (DUP/EMPTY) - {acc['email']} - {mail_row['subject'][:60]}"
             )
 
-def run_once():
-    accounts = get_accounts()
+    # watermarks move only after every fetched mail is stored
+    _save_sync(acc, imap_sync, delta_link)
+
+def run_once(only: set | None = None):
+    """
+    Full cycle, or only the given account ids (IDLE wake-ups).
+    """
+    accounts = get_snapshot()
     if not accounts:
         logging.info("NO ACCOUNTS FOUND")
         return
 
-    for acc in accounts:
-        try:
-            process_account(acc)
-        except Exception as e:
-            logging.error(f"ACCOUNT ERROR {acc.get('email')}: {e}")
+    if only is None:
+        active = {acc["id"] for acc in accounts}
+        _IMAP_POOL.prune(active)
+        forget_compiled_rules(active)
+        forget_payloads({str(a) for a in active})
+        with _SEEN_LOCK:
+            for account_id in [a for a in _SEEN if a not in active]:
+                del _SEEN[account_id]
+        _IMAP_POOL.keepalive()
+    else:
+        accounts = [acc for acc in accounts if acc["id"] in only]
+
+    run_accounts(accounts, process_account)
+
+    st = classification_cache.stats()
+    logging.info(
+        f"CLASSIFY CACHE | hits={st['memory_hits']}+{st['shared_hits']} misses={st['misses']} "
+        f"ratio={st['hit_ratio']} llm_s={st['llm_seconds']} saved_s={st['llm_seconds_saved']} size={st['size']}"
+    )
 
 def service_loop():
     INTRO()
@@ -153,7 +321,21 @@ def service_loop():
         except Exception as e:
             logging.error(f"RUN ERROR: {e}")
 
-        time.sleep(FETCH_INTERVAL)
+        # sleep until the next full cycle, serving IDLE wake-ups meanwhile
+        deadline = time.monotonic() + FETCH_INTERVAL
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not _WAKE.wait(remaining):
+                break
+            _WAKE.clear()
+
+            woken = _take_woken()
+            if not woken:
+                continue
+            try:
+                run_once(only=woken)
+            except Exception as e:
+                logging.error(f"RUN ERROR: {e}")
 
 if __name__ == "__main__":
     service_loop()
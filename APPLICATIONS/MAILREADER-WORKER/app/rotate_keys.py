@@ -0,0 +1,59 @@
+# Re-encrypts every stored secret under the current MAILREADER_MASTER_KEY.
+#
+# Rotation:
+#   1. worker + API: MAILREADER_MASTER_KEY=<new>, MAILREADER_OLD_KEYS=<old>
+#   2. python -m app.rotate_keys   (same image / env as the worker)
+#   3. remove MAILREADER_OLD_KEYS once it exits 0
+import sys
+import logging
+
+from app.db import get_all_secrets, replace_secret_payload
+from app.security import rotate_payload
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(message)s",
+    datefmt="%d-%b-%y %H:%M:%S",
+)
+
+# a concurrent update (token refresh) makes the swap fail; retry from a fresh read
+MAX_PASSES = 3
+
+
+def rotate_all() -> int:
+    """
+    Returns the number of secrets that could not be rotated.
+    """
+    pending = get_all_secrets()
+    rotated = 0
+    failed = []
+
+    for _ in range(MAX_PASSES):
+        conflicts = set()
+
+        for row in pending:
+            try:
+                new_payload = rotate_payload(row["enc_payload"])
+            except Exception as e:
+                logging.error(f"ROTATE FAILED {row['account_id']}: {e}")
+                failed.append(row)
+                continue
+
+            if replace_secret_payload(row["account_id"], row["enc_payload"], new_payload):
+                rotated += 1
+            else:
+                conflicts.add(str(row["account_id"]))
+
+        if not conflicts:
+            logging.info(f"SECRETS ROTATED: {rotated}, FAILED: {len(failed)}")
+            return len(failed)
+
+        logging.info(f"SECRETS CHANGED DURING ROTATION: {len(conflicts)}, RETRYING")
+        pending = [r for r in get_all_secrets() if str(r["account_id"]) in conflicts]
+
+    logging.error(f"SECRETS ROTATED: {rotated}, STILL CONFLICTING: {len(conflicts)}")
+    return len(conflicts) + len(failed)
+
+
+if __name__ == "__main__":
+    sys.exit(1 if rotate_all() else 0)
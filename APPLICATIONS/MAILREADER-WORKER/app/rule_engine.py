@@ -1,35 +1,205 @@
-def _match_condition(mail: dict, cond: dict) -> bool:
-    field = (cond.get("field") or "").strip()
-    op = (cond.get("op") or "icontains").strip().lower()
-    value = (cond.get("value") or "").strip()
+import json
+import hashlib
+import threading
+from collections import deque
 
-    target = str(mail.get(field, "") or "")
+_NO_MATCH = float("inf")
 
-    if op in ("icontains", "contains"):
-        return value.lower() in target.lower()
-    if op in ("eq", "equals"):
-        return target.strip().lower() == value.strip().lower()
 
-    # default fallback
-    return value.lower() in target.lower()
+class _Automaton:
+    """
+    Aho–Corasick over lowered needles.
+    Each needle carries the index of the first rule using it; a scan returns
+    the smallest index matched anywhere in the text.
+    """
+
+    __slots__ = ("_goto", "_fail", "_out", "min_index")
+
+    def __init__(self, needles: dict):
+        goto = [{}]
+        out = [_NO_MATCH]
+
+        for needle, idx in needles.items():
+            node = 0
+            for ch in needle:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    goto.append({})
+                    out.append(_NO_MATCH)
+                    nxt = len(goto) - 1
+                    goto[node][ch] = nxt
+                node = nxt
+            out[node] = min(out[node], idx)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            r = queue.popleft()
+            for ch, s in goto[r].items():
+                queue.append(s)
+                f = fail[r]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[s] = goto[f].get(ch, 0)
+                # inherit matches of the longest proper suffix
+                out[s] = min(out[s], out[fail[s]])
+
+        self._goto = tuple(goto)
+        self._fail = tuple(fail)
+        self._out = tuple(out)
+        self.min_index = min(needles.values())
+
+    def best(self, text: str) -> float:
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        best = _NO_MATCH
+
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node] < best:
+                best = out[node]
+                if best == self.min_index:
+                    break
+
+        return best
+
+
+class CompiledRules:
+    """
+    Immutable matcher built once from an account's rules (priority order).
+    Same semantics as the rule schema below: a rule fires when ANY of its
+    conditions matches, the first firing rule wins.
+
+    Per field it keeps:
+      - an Aho–Corasick automaton for contains/icontains (and unknown ops)
+      - a dict for eq/equals on the stripped, lowered value
+      - the first rule with an empty needle (matches every mail)
+    """
+
+    __slots__ = ("_results", "_fields")
+
+    def __init__(self, rules: list):
+        results = []
+        per_field = {}
+
+        for r in rules:
+            conditions = r.get("conditions") or []
+            if not isinstance(conditions, list):
+                continue
+
+            idx = len(results)
+            results.append((r.get("action") or {}, r.get("name") or "rule"))
+
+            for cond in conditions:
+                if not isinstance(cond, dict):
+                    continue
+
+                field = (cond.get("field") or "").strip()
+                op = (cond.get("op") or "icontains").strip().lower()
+                value = (cond.get("value") or "").strip().lower()
+
+                slot = per_field.setdefault(field, {"contains": {}, "eq": {}, "always": _NO_MATCH})
+
+                if op in ("eq", "equals"):
+                    slot["eq"].setdefault(value, idx)
+                elif not value:
+                    slot["always"] = min(slot["always"], idx)
+                else:
+                    slot["contains"].setdefault(value, idx)
+
+        self._results = tuple(results)
+        self._fields = tuple(
+            (
+                field,
+                _Automaton(slot["contains"]) if slot["contains"] else None,
+                dict(slot["eq"]),
+                slot["always"],
+            )
+            for field, slot in per_field.items()
+        )
+
+    def __len__(self):
+        return len(self._results)
 
+    def match(self, mail: dict):
+        """
+        Returns: (action_dict, rule_name) or (None, None)
+        """
+        best = _NO_MATCH
 
-def apply_rules(mail: dict, rules: list):
+        for field, automaton, eq, always in self._fields:
+            if always < best:
+                best = always
+
+            target = str(mail.get(field, "") or "")
+
+            if eq:
+                idx = eq.get(target.strip().lower())
+                if idx is not None and idx < best:
+                    best = idx
+
+            if automaton is not None and automaton.min_index < best:
+                idx = automaton.best(target.lower())
+                if idx < best:
+                    best = idx
+
+        if best == _NO_MATCH:
+            return None, None
+        return self._results[best]
+
+
+def compile_rules(rules: list) -> CompiledRules:
+    return CompiledRules(rules)
+
+
+# account_id -> (fingerprint, CompiledRules)
+_COMPILED = {}
+_COMPILED_LOCK = threading.Lock()
+
+
+def _fingerprint(rules: list) -> str:
+    raw = json.dumps(rules, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def get_compiled_rules(account_id, rules: list) -> CompiledRules:
+    """
+    Reuses the account's matcher across mails and cycles; recompiles only
+    when the rule rows changed.
+    """
+    fp = _fingerprint(rules)
+
+    with _COMPILED_LOCK:
+        cached = _COMPILED.get(account_id)
+        if cached and cached[0] == fp:
+            return cached[1]
+
+    compiled = CompiledRules(rules)
+
+    with _COMPILED_LOCK:
+        _COMPILED[account_id] = (fp, compiled)
+    return compiled
+
+
+def forget_compiled_rules(active_ids: set):
+    """
+    Drops matchers of accounts that no longer exist.
+    """
+    with _COMPILED_LOCK:
+        for account_id in [a for a in _COMPILED if a not in active_ids]:
+            del _COMPILED[account_id]
+
+
+def apply_rules(mail: dict, rules):
     """
     Returns: (action_dict, rule_name) or (None, None)
     Rule schema:
       conditions: [{"field":"subject","op":"icontains","value":"invoice"}]
       action: {"set_category":"important"}  OR {"set_category":"spam"}
+    `rules` may be the raw rule list or a CompiledRules.
     """
-    for r in rules:
-        conditions = r.get("conditions") or []
-        if not isinstance(conditions, list):
-            continue
-
-        for cond in conditions:
-            if not isinstance(cond, dict):
-                continue
-            if _match_condition(mail, cond):
-                return r.get("action") or {}, r.get("name") or "rule"
-
-    return None, None
+    if not isinstance(rules, CompiledRules):
+        rules = CompiledRules(rules)
+    return rules.match(mail)
@@ -0,0 +1,95 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# ========================== CONFIG ==========================
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "16"))
+PER_HOST_CONCURRENCY = int(os.getenv("PER_HOST_CONCURRENCY", "4"))
+ACCOUNT_TIMEOUT = int(os.getenv("ACCOUNT_TIMEOUT", "300"))
+
+# Long-lived pool: an account that overruns ACCOUNT_TIMEOUT keeps its thread
+# until its own socket/HTTP timeouts fire, so the pool must outlive the cycle.
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=WORKER_CONCURRENCY,
+    thread_name_prefix="account",
+)
+
+_IN_FLIGHT = set()
+_IN_FLIGHT_LOCK = threading.Lock()
+
+_HOST_SLOTS = {}
+_HOST_SLOTS_LOCK = threading.Lock()
+
+
+# ========================== HOST CAP ==========================
+@contextmanager
+def host_slot(key: str):
+    """
+    Limits concurrent work against one IMAP host / Exchange tenant.
+    """
+    with _HOST_SLOTS_LOCK:
+        sem = _HOST_SLOTS.get(key)
+        if sem is None:
+            sem = threading.BoundedSemaphore(PER_HOST_CONCURRENCY)
+            _HOST_SLOTS[key] = sem
+
+    if not sem.acquire(timeout=ACCOUNT_TIMEOUT):
+        raise TimeoutError(f"host slot wait timed out for {key}")
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+# ========================== RUNNER ==========================
+def _run(fn, acc: dict):
+    try:
+        fn(acc)
+    except Exception as e:
+        logging.error(f"ACCOUNT ERROR {acc.get('email')}: {e}")
+    finally:
+        with _IN_FLIGHT_LOCK:
+            _IN_FLIGHT.discard(acc["id"])
+
+
+def run_accounts(accounts: list, fn):
+    """
+    Runs fn(acc) for every account on the shared pool.
+    Returns once every account finished or exceeded ACCOUNT_TIMEOUT.
+    Accounts still running from a previous cycle are skipped.
+    """
+    futures = {}
+    for acc in accounts:
+        with _IN_FLIGHT_LOCK:
+            if acc["id"] in _IN_FLIGHT:
+                logging.warning(f"ACCOUNT STILL RUNNING, SKIPPED - {acc.get('email')}")
+                continue
+            _IN_FLIGHT.add(acc["id"])
+
+        futures[_EXECUTOR.submit(_run, fn, acc)] = acc
+
+    # queued work does not count against the timeout, only running work
+    started = {}
+    pending = set(futures)
+
+    while pending:
+        now = time.monotonic()
+        for fut in pending:
+            if fut.running() and fut not in started:
+                started[fut] = now
+
+        expired = {
+            fut for fut in pending
+            if fut in started and now - started[fut] > ACCOUNT_TIMEOUT
+        }
+        for fut in expired:
+            logging.error(f"ACCOUNT TIMEOUT {futures[fut].get('email')} (> {ACCOUNT_TIMEOUT}s)")
+        pending -= expired
+
+        if not pending:
+            break
+
+        _, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
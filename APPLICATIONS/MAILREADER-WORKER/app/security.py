@@ -1,22 +1,91 @@
 import os
 import json
-from cryptography.fernet import Fernet
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from cryptography.fernet import Fernet, MultiFernet
 
+# ========================== CONFIG ==========================
+SECRET_CACHE_TTL = int(os.getenv("SECRET_CACHE_TTL", "3600"))
+SECRET_CACHE_SIZE = int(os.getenv("SECRET_CACHE_SIZE", "10000"))
 
-def _get_fernet() -> Fernet:
-    key = os.getenv("MAILREADER_MASTER_KEY", "").strip()
-    if not key:
-        raise RuntimeError("MAILREADER_MASTER_KEY is not set")
-    return Fernet(key.encode())
+_FERNET = None
+_FERNET_LOCK = threading.Lock()
 
+# (account_id, sha256(ciphertext)) -> (expires_at, payload)
+_PAYLOADS = OrderedDict()
+_PAYLOADS_LOCK = threading.Lock()
 
-def decrypt_payload(enc_payload: str) -> dict:
-    f = _get_fernet()
-    raw = f.decrypt(enc_payload.encode()).decode("utf-8")
-    return json.loads(raw)
+
+def _get_fernet() -> MultiFernet:
+    """
+    Built once per process.
+    MAILREADER_MASTER_KEY encrypts; MAILREADER_OLD_KEYS (comma separated)
+    are only tried for decryption while secrets are being rotated.
+    """
+    global _FERNET
+    if _FERNET is not None:
+        return _FERNET
+
+    with _FERNET_LOCK:
+        if _FERNET is None:
+            key = os.getenv("MAILREADER_MASTER_KEY", "").strip()
+            if not key:
+                raise RuntimeError("MAILREADER_MASTER_KEY is not set")
+            old_keys = [k.strip() for k in os.getenv("MAILREADER_OLD_KEYS", "").split(",") if k.strip()]
+            _FERNET = MultiFernet([Fernet(k.encode()) for k in [key] + old_keys])
+    return _FERNET
+
+
+def decrypt_payload(enc_payload: str, account_id=None) -> dict:
+    """
+    With account_id the result is cached (SECRET_CACHE_TTL) under the
+    ciphertext hash, so a re-encrypted secret (token refresh, rotation) is
+    never served stale. Callers get their own copy and may modify it.
+    """
+    if account_id is None:
+        raw = _get_fernet().decrypt(enc_payload.encode()).decode("utf-8")
+        return json.loads(raw)
+
+    key = (str(account_id), hashlib.sha256(enc_payload.encode()).hexdigest())
+
+    with _PAYLOADS_LOCK:
+        entry = _PAYLOADS.get(key)
+        if entry and entry[0] > time.monotonic():
+            _PAYLOADS.move_to_end(key)
+            return dict(entry[1])
+
+    raw = _get_fernet().decrypt(enc_payload.encode()).decode("utf-8")
+    payload = json.loads(raw)
+
+    with _PAYLOADS_LOCK:
+        _PAYLOADS[key] = (time.monotonic() + SECRET_CACHE_TTL, payload)
+        _PAYLOADS.move_to_end(key)
+        while len(_PAYLOADS) > SECRET_CACHE_SIZE:
+            _PAYLOADS.popitem(last=False)
+
+    return dict(payload)
 
 
 def encrypt_payload(payload: dict) -> str:
     f = _get_fernet()
     raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
     return f.encrypt(raw).decode("utf-8")
+
+
+def rotate_payload(enc_payload: str) -> str:
+    """
+    Re-encrypts a token under the current MAILREADER_MASTER_KEY
+    (decrypting with any configured key).
+    """
+    return _get_fernet().rotate(enc_payload.encode()).decode("utf-8")
+
+
+def forget_payloads(active_ids: set):
+    """
+    Drops cached payloads of accounts that no longer exist.
+    """
+    with _PAYLOADS_LOCK:
+        for key in [k for k in _PAYLOADS if k[0] not in active_ids]:
+            del _PAYLOADS[key]
@@ -0,0 +1,180 @@
+import os
+import sys
+import socket
+import threading
+import socketserver
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# ========================== IMAP STAND-IN ==========================
+class _ImapHandler(socketserver.BaseRequestHandler):
+    """
+    Just enough IMAP4rev1 for the pool: CAPABILITY, LOGIN, SELECT/EXAMINE,
+    NOOP, IDLE/DONE and LOGOUT. Connections are tracked per user.
+    """
+
+    def setup(self):
+        self.buf = b""
+        self.user = None
+        self.request.settimeout(0.05)
+
+    def _line(self, stop=None):
+        while b"\r\n" not in self.buf:
+            if stop is not None and stop():
+                return None
+            try:
+                data = self.request.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                return b""
+            if not data:
+                return b""
+            self.buf += data
+        line, self.buf = self.buf.split(b"\r\n", 1)
+        return line
+
+    def _send(self, text):
+        self.request.sendall(text.encode() + b"\r\n")
+
+    def handle(self):
+        srv = self.server
+        srv.opened(self)
+        try:
+            self._send("* OK [CAPABILITY IMAP4rev1 IDLE] stand-in ready")
+            while True:
+                line = self._line(stop=lambda: self in srv.dropped)
+                if not line:
+                    return
+                tag, _, rest = line.decode().partition(" ")
+                cmd, _, args = rest.partition(" ")
+                cmd = cmd.upper()
+
+                if cmd == "CAPABILITY":
+                    self._send("* CAPABILITY IMAP4rev1 IDLE")
+                    self._send(f"{tag} OK done")
+                elif cmd == "LOGIN":
+                    srv.logins += 1
+                    if srv.fail_login:
+                        self._send(f"{tag} NO [AUTHENTICATIONFAILED] nope")
+                        continue
+                    self.user = args.split(" ")[0].strip('"')
+                    srv.logged_in(self)
+                    self._send(f"{tag} OK [CAPABILITY IMAP4rev1 IDLE] logged in")
+                elif cmd in ("SELECT", "EXAMINE"):
+                    self._send("* 3 EXISTS")
+                    self._send("* OK [UIDVALIDITY 1] ok")
+                    self._send("* OK [UIDNEXT 4] ok")
+                    self._send(f"{tag} OK [READ-ONLY] done")
+                elif cmd == "NOOP":
+                    self._send(f"{tag} OK done")
+                elif cmd == "IDLE":
+                    self._send("+ idling")
+                    srv.set_idle(self, True)
+                    while True:
+                        for _ in srv.take_pushes(self.user):
+                            self._send("* 4 EXISTS")
+                        line = self._line(stop=lambda: self.user in srv.pushes or self in srv.dropped)
+                        if line is None:
+                            if self in srv.dropped:
+                                return
+                            continue
+                        break
+                    srv.set_idle(self, False)
+                    if not line:
+                        return
+                    self._send(f"{tag} OK idle done")
+                elif cmd == "LOGOUT":
+                    srv.logged_out(self)
+                    self._send("* BYE bye")
+                    self._send(f"{tag} OK done")
+                    return
+                else:
+                    self._send(f"{tag} BAD unknown command")
+        finally:
+            srv.closed(self)
+
+
+class ImapStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ImapHandler)
+        self.lock = threading.Condition()
+        self.conns = set()
+        self.active = set()         # logged in, not logged out
+        self.max_concurrent = 0
+        self.logins = 0
+        self.fail_login = False
+        self.sessions_by_user = {}  # user -> logins
+        self.idle = set()
+        self.pushes = {}
+        self.dropped = set()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def opened(self, h):
+        with self.lock:
+            self.conns.add(h)
+
+    def closed(self, h):
+        with self.lock:
+            self.conns.discard(h)
+            self.active.discard(h)
+            self.idle.discard(h.user)
+            self.lock.notify_all()
+
+    def logged_in(self, h):
+        with self.lock:
+            self.active.add(h)
+            self.max_concurrent = max(self.max_concurrent, len(self.active))
+            self.sessions_by_user[h.user] = self.sessions_by_user.get(h.user, 0) + 1
+
+    def logged_out(self, h):
+        with self.lock:
+            self.active.discard(h)
+            self.lock.notify_all()
+
+    def set_idle(self, h, idle):
+        with self.lock:
+            (self.idle.add if idle else self.idle.discard)(h.user)
+            self.lock.notify_all()
+
+    def take_pushes(self, user):
+        with self.lock:
+            return [None] * self.pushes.pop(user, 0)
+
+    def push_exists(self, user):
+        with self.lock:
+            self.pushes[user] = self.pushes.get(user, 0) + 1
+
+    def drop(self, user):
+        with self.lock:
+            for h in self.conns:
+                if h.user == user:
+                    self.dropped.add(h)
+        self.wait_for(lambda: all(h.user != user for h in self.conns))
+
+    def open_users(self):
+        with self.lock:
+            return sorted(h.user for h in self.conns if h.user)
+
+    def wait_for(self, predicate, timeout=10):
+        with self.lock:
+            return self.lock.wait_for(predicate, timeout=timeout)
+
+
+@pytest.fixture
+def imap_server():
+    srv = ImapStandIn()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
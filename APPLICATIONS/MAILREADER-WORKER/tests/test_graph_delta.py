@@ -0,0 +1,139 @@
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+import requests
+
+from app import graph_client
+from app.graph_client import fetch_graph_delta
+
+DELTA_PATH = "/v1.0/me/mailFolders/Inbox/messages/delta"
+PAGES = 5
+PER_PAGE = 3
+
+
+def _message(n: int) -> dict:
+    return {
+        "id": f"graph-{n}",
+        "internetMessageId": f"<{n}@example.com>",
+        "subject": f"mail {n}",
+        "from": {"emailAddress": {"address": f"sender{n}@example.com"}},
+        "toRecipients": [{"emailAddress": {"address": "me@example.com"}}],
+        "bodyPreview": f"body {n}",
+    }
+
+
+class _GraphHandler(BaseHTTPRequestHandler):
+    """
+    Inbox delta of PAGES x PER_PAGE mails in @odata.nextLink pages.
+    deltatoken=t1 -> one new mail + one removal, deltatoken=expired -> 410.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        srv = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        srv.requests.append((url.path, query, dict(self.headers)))
+
+        if url.path != DELTA_PATH:
+            return self._json(404, {"error": {"code": "NotFound"}})
+
+        base = f"http://127.0.0.1:{srv.server_address[1]}{DELTA_PATH}"
+        token = query.get("$deltatoken", [None])[0]
+
+        if token == "expired":
+            return self._json(410, {"error": {"code": "SyncStateNotFound"}})
+        if token == "t1":
+            return self._json(200, {
+                "value": [_message(100), {"id": "graph-1", "@removed": {"reason": "deleted"}}],
+                "@odata.deltaLink": f"{base}?$deltatoken=t2",
+            })
+
+        page = int(query.get("$skiptoken", ["0"])[0])
+        body = {"value": [_message(page * PER_PAGE + i) for i in range(PER_PAGE)]}
+        if page == 2:
+            body["value"].append({"id": "graph-gone", "@removed": {"reason": "changed"}})
+        if page + 1 < PAGES:
+            body["@odata.nextLink"] = f"{base}?$skiptoken={page + 1}"
+        else:
+            body["@odata.deltaLink"] = f"{base}?$deltatoken=t1"
+        self._json(200, body)
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _GraphHandler)
+    srv.requests = []
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(graph_client, "GRAPH_BASE", f"http://127.0.0.1:{srv.server_address[1]}/v1.0")
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _subjects(mails):
+    return [m["subject"] for m in mails]
+
+
+def test_initial_round_follows_every_next_link(graph):
+    mails, delta_link = fetch_graph_delta("tok", since=datetime(2024, 1, 2, 3, 4, 5))
+
+    assert _subjects(mails) == [f"mail {n}" for n in range(PAGES * PER_PAGE)]
+    assert mails[0] == {
+        "message_id": "<0@example.com>",
+        "subject": "mail 0",
+        "from": "sender0@example.com",
+        "to": "me@example.com",
+        "body": "body 0",
+    }
+    assert delta_link.endswith("$deltatoken=t1")
+
+    assert len(graph.requests) == PAGES
+    _, first_query, _ = graph.requests[0]
+    assert first_query["$select"] == [graph_client.GRAPH_SELECT]
+    assert first_query["$filter"] == ["receivedDateTime ge 2024-01-02T03:04:05Z"]
+    for _, _, headers in graph.requests:
+        assert headers["Authorization"] == "Bearer tok"
+        assert headers["Prefer"] == f"odata.maxpagesize={graph_client.GRAPH_PAGE_SIZE}"
+    # next links are used as given, without re-adding the initial options
+    for _, query, _ in graph.requests[1:]:
+        assert "$filter" not in query
+
+
+def test_delta_round_skips_removed_entries(graph):
+    _, delta_link = fetch_graph_delta("tok")
+    mails, next_delta = fetch_graph_delta("tok", delta_link=delta_link)
+
+    assert _subjects(mails) == ["mail 100"]
+    assert next_delta.endswith("$deltatoken=t2")
+
+
+def test_expired_delta_link_restarts_initial_round(graph):
+    base = graph_client.GRAPH_BASE + "/me/mailFolders/Inbox/messages/delta"
+    mails, delta_link = fetch_graph_delta("tok", delta_link=f"{base}?$deltatoken=expired")
+
+    assert _subjects(mails) == [f"mail {n}" for n in range(PAGES * PER_PAGE)]
+    assert delta_link.endswith("$deltatoken=t1")
+    # one 410, then the full initial round
+    assert len(graph.requests) == 1 + PAGES
+    assert graph.requests[1][1]["$select"] == [graph_client.GRAPH_SELECT]
+
+
+def test_other_errors_are_raised(graph):
+    with pytest.raises(requests.HTTPError):
+        fetch_graph_delta("tok", delta_link=f"{graph_client.GRAPH_BASE}/nowhere")
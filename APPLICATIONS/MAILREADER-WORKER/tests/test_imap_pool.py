@@ -0,0 +1,149 @@
+import time
+import threading
+
+import pytest
+from imapclient import IMAPClient
+from imapclient.exceptions import LoginError
+
+from app import imap_pool
+from app.imap_pool import ImapPool
+
+
+@pytest.fixture
+def pool(imap_server, monkeypatch):
+    def plain_connect(host, username, password, port=993):
+        server = IMAPClient(host, port=port, ssl=False, timeout=5)
+        server.login(username, password)
+        return server
+
+    monkeypatch.setattr(imap_pool, "connect", plain_connect)
+    monkeypatch.setattr(imap_pool, "IMAP_CONNECT_WAIT", 2)
+    monkeypatch.setattr(imap_pool, "IMAP_IDLE_CHECK", 0.2)
+
+    p = ImapPool()
+    yield p
+    p.close_all()
+
+
+def _use(pool, server, key):
+    with pool.session(key, "127.0.0.1", server.port, key, "secret") as client:
+        client.noop()
+
+
+def _watch(pool, server, key, on_new_mail=lambda key: None):
+    pool.watch(key, "127.0.0.1", server.port, key, "secret", on_new_mail)
+
+
+def test_host_cap_evicts_least_recently_used(pool, imap_server, monkeypatch):
+    monkeypatch.setattr(imap_pool, "IMAP_MAX_CONN_PER_HOST", 2)
+
+    for key in ("a", "b", "c"):
+        _use(pool, imap_server, key)
+
+    assert imap_server.wait_for(lambda: imap_server.open_users() == ["b", "c"])
+    assert imap_server.max_concurrent <= 2
+
+
+def test_watchers_leave_room_for_fetches(pool, imap_server, monkeypatch):
+    # before the watcher cap, 20 watched accounts starved every later one
+    monkeypatch.setattr(imap_pool, "IMAP_MAX_CONN_PER_HOST", 3)
+    monkeypatch.setattr(imap_pool, "IMAP_MAX_WATCH_PER_HOST", 2)
+    keys = ["a", "b", "c", "d", "e"]
+
+    for key in keys:
+        _use(pool, imap_server, key)
+        _watch(pool, imap_server, key)
+
+    assert imap_server.wait_for(lambda: len(imap_server.idle) == 2)
+
+    for _ in range(2):
+        for key in keys:
+            started = time.monotonic()
+            _use(pool, imap_server, key)
+            assert time.monotonic() - started < 1.5
+
+    assert len(pool._watchers) == 2
+    assert imap_server.max_concurrent <= 3
+
+
+def test_full_host_of_watchers_stops_the_lru_watcher(pool, imap_server, monkeypatch):
+    monkeypatch.setattr(imap_pool, "IMAP_MAX_CONN_PER_HOST", 2)
+    monkeypatch.setattr(imap_pool, "IMAP_MAX_WATCH_PER_HOST", 2)
+
+    for key in ("a", "b"):
+        _use(pool, imap_server, key)
+        _watch(pool, imap_server, key)
+        assert imap_server.wait_for(lambda: key in imap_server.idle)
+
+    _use(pool, imap_server, "c")
+
+    assert "a" not in pool._watchers
+    assert "b" in pool._watchers
+    assert imap_server.max_concurrent <= 2
+
+
+def test_fetch_takes_over_the_idle_connection(pool, imap_server):
+    woken = threading.Event()
+    _use(pool, imap_server, "a")
+    _watch(pool, imap_server, "a", lambda key: woken.set())
+    assert imap_server.wait_for(lambda: "a" in imap_server.idle)
+
+    started = time.monotonic()
+    _use(pool, imap_server, "a")
+    assert time.monotonic() - started < 1.5
+
+    # same socket: no second login, and the watcher goes back to IDLE
+    assert imap_server.sessions_by_user["a"] == 1
+    assert imap_server.wait_for(lambda: "a" in imap_server.idle)
+
+    imap_server.push_exists("a")
+    assert woken.wait(5)
+
+
+def test_reconnect_with_backoff(pool, imap_server):
+    imap_server.fail_login = True
+    with pytest.raises(LoginError):
+        _use(pool, imap_server, "a")
+
+    sess = pool._sessions["a"]
+    assert sess.failures == 1
+    assert 1.5 < sess.retry_at - time.monotonic() <= 2
+
+    # inside the backoff window nothing is sent to the server
+    logins = imap_server.logins
+    with pytest.raises(ConnectionError):
+        _use(pool, imap_server, "a")
+    assert imap_server.logins == logins
+
+    imap_server.fail_login = False
+    sess.retry_at = 0
+    _use(pool, imap_server, "a")
+    assert sess.failures == 0
+
+    # a dropped connection fails the current use; the next one reconnects
+    imap_server.drop("a")
+    with pytest.raises(Exception):
+        _use(pool, imap_server, "a")
+    _use(pool, imap_server, "a")
+    assert imap_server.sessions_by_user["a"] == 2
+
+
+def test_host_change_moves_session_and_watcher(pool, imap_server):
+    _use(pool, imap_server, "a")
+    _watch(pool, imap_server, "a")
+    assert imap_server.wait_for(lambda: "a" in imap_server.idle)
+
+    with pool.session("a", "localhost", imap_server.port, "a", "secret") as client:
+        client.noop()
+
+    sess = pool._sessions["a"]
+    assert sess.host == "localhost"
+    # the old host's slot is free again and its watcher is gone
+    assert pool._slot("127.0.0.1")._value == imap_pool.IMAP_MAX_CONN_PER_HOST
+    assert pool._slot("localhost")._value == imap_pool.IMAP_MAX_CONN_PER_HOST - 1
+    assert "a" not in pool._watchers
+
+    pool.watch("a", "localhost", imap_server.port, "a", "secret", lambda key: None)
+    assert pool._watchers["a"][2] == "localhost"
+    assert imap_server.wait_for(lambda: "a" in imap_server.idle)
+    assert imap_server.sessions_by_user["a"] == 2